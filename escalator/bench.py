@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+
+from client import Escalator
+from server.stats import Histogram
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+WORKLOADS = {
+    'read': {'get': 95, 'put': 5},
+    'write': {'put': 100},
+    'mixed': {'get': 50, 'put': 50},
+    'exists': {'exists': 90, 'put': 10},
+    'scan': {'range': 95, 'put': 5},
+    'batch': {'batch': 100},
+    'all': {'get': 40, 'put': 20, 'exists': 20, 'range': 10, 'batch': 10},
+}
+
+
+def parse_mix(spec):
+    if spec in WORKLOADS:
+        return WORKLOADS[spec]
+    mix = {}
+    for item in spec.split(','):
+        op, weight = item.split('=')
+        if op not in OPERATIONS:
+            raise argparse.ArgumentTypeError("unknown operation " + op)
+        mix[op] = int(weight)
+    return mix
+
+
+def parse_size(spec):
+    low, _, high = spec.partition('-')
+    return int(low), int(high or low)
+
+
+def start_server(mode, port, workers, dbs, extra_args):
+    os.makedirs(dbs)
+    return subprocess.Popen([sys.executable, '-m', 'server',
+                             '--mode', mode,
+                             '--port', str(port),
+                             '--workers', str(workers),
+                             '--dbs', dbs] + extra_args,
+                            cwd=here, start_new_session=True)
+
+
+def stop_server(server):
+    os.killpg(server.pid, signal.SIGTERM)
+    server.wait()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=here).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Workload(object):
+    def __init__(self, options, seed):
+        self.options = options
+        self.random = random.Random(seed)
+        self.payload = os.urandom(options.value_size[1])
+        ops, weights = zip(*sorted(options.mix.items()))
+        self.ops = ops
+        self.cum_weights = []
+        total = 0
+        for weight in weights:
+            total += weight
+            self.cum_weights.append(total)
+
+    def key(self):
+        if self.options.key_dist == 'hot':
+            # 80% of the requests go to 20% of the keys
+            hot = max(1, self.options.keys // 5)
+            if self.random.random() < 0.8:
+                index = self.random.randrange(hot)
+            else:
+                index = self.random.randrange(hot, self.options.keys)
+        else:
+            index = self.random.randrange(self.options.keys)
+        return format_key(index, self.options.key_size)
+
+    def value(self):
+        return self.payload[:self.random.randint(*self.options.value_size)]
+
+    def next_op(self):
+        return self.random.choices(self.ops, cum_weights=self.cum_weights)[0]
+
+
+def format_key(index, size):
+    return str(index).zfill(size).encode()
+
+
+def op_get(client, workload):
+    client.get_default(workload.key(), pack=False)
+
+
+def op_exists(client, workload):
+    client.exists(workload.key())
+
+
+def op_put(client, workload):
+    client.put(workload.key(), workload.value(), pack=False)
+
+
+def op_range(client, workload):
+    client.range_page(start=workload.key(), pack=False,
+                      limit=workload.options.range_size)
+
+
+def op_batch(client, workload):
+    with client.write_batch() as wb:
+        for _ in range(workload.options.batch_size):
+            wb.put(workload.key(), workload.value(), pack=False)
+
+
+OPERATIONS = {
+    'get': op_get,
+    'exists': op_exists,
+    'put': op_put,
+    'range': op_range,
+    'batch': op_batch,
+}
+
+
+def preload(port, options):
+    workload = Workload(options, options.seed)
+    for d in range(options.databases):
+        client = Escalator('bench{}'.format(d), port=port, create_db=True,
+                           version=options.protocol_version)
+        for start in range(0, options.keys, 1000):
+            with client.write_batch() as wb:
+                for i in range(start, min(start + 1000, options.keys)):
+                    wb.put(format_key(i, options.key_size), workload.value(),
+                           pack=False)
+        client.context.destroy(linger=0)
+
+
+def run_clients(port, nb_clients, options):
+    def work(w):
+        client = Escalator('bench{}'.format(w % options.databases),
+                           port=port, version=options.protocol_version)
+        workload = Workload(options, options.seed + w + 1)
+        histograms = dict((op, Histogram()) for op in options.mix)
+        for _ in range(options.requests):
+            op = workload.next_op()
+            start = time.time()
+            error = False
+            try:
+                OPERATIONS[op](client, workload)
+            except Exception:
+                error = True
+            histograms[op].record(int((time.time() - start) * 1000000),
+                                  error)
+        client.context.destroy(linger=0)
+        return histograms
+
+    pool = ThreadPool(nb_clients)
+    start = time.time()
+    results = pool.map(work, range(nb_clients))
+    elapsed = time.time() - start
+    pool.close()
+
+    histograms = dict((op, Histogram()) for op in options.mix)
+    for result in results:
+        for op, histogram in result.items():
+            histograms[op].merge(histogram)
+    total = Histogram()
+    for histogram in histograms.values():
+        total.merge(histogram)
+
+    return {
+        'elapsed': elapsed,
+        'throughput': total.count / elapsed,
+        'latency': total.summary(),
+        'operations': dict((op, h.summary())
+                           for op, h in histograms.items())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark a local escalator server. Unknown arguments "
+                    "are passed to the server.")
+    parser.add_argument('--modes', nargs='+',
+                        default=['proxy', 'inproc', 'router', 'sharded'])
+    parser.add_argument('--port', type=int, default=4324)
+    parser.add_argument('--workers', type=int, nargs='+', default=[8])
+    parser.add_argument('--clients', type=int, nargs='+', default=[32])
+    parser.add_argument('--requests', type=int, default=2000,
+                        help="requests per client")
+    parser.add_argument('--databases', type=int, default=8,
+                        help="clients are spread over this many databases")
+    parser.add_argument('--workload', type=parse_mix, default='mixed',
+                        dest='mix',
+                        help="one of {} or a mix like 'get=80,put=20'"
+                             .format(', '.join(sorted(WORKLOADS))))
+    parser.add_argument('--keys', type=int, default=10000,
+                        help="keys preloaded in each database")
+    parser.add_argument('--key-size', type=int, default=16)
+    parser.add_argument('--key-dist', choices=['uniform', 'hot'],
+                        default='uniform')
+    parser.add_argument('--value-size', type=parse_size, default='100',
+                        help="fixed size or uniform range like '10-1000'")
+    parser.add_argument('--range-size', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--protocol-version', type=int, choices=(1, 2),
+                        default=2, help="wire protocol used by the clients")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--startup', type=float, default=1,
+                        help="seconds to wait for the server to start")
+    parser.add_argument('--output', help="write the JSON report here")
+    options, server_args = parser.parse_known_args()
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': dict((k, v) for k, v in vars(options).items()
+                       if k != 'output'),
+        'server_args': server_args,
+        'results': []
+    }
+
+    tmp = tempfile.mkdtemp(prefix='escalator-bench-')
+    try:
+        for mode in options.modes:
+            for workers in options.workers:
+                dbs = os.path.join(tmp, '{}-{}'.format(mode, workers))
+                server = start_server(mode, options.port, workers, dbs,
+                                      server_args)
+                try:
+                    time.sleep(options.startup)
+                    preload(options.port, options)
+                    for clients in options.clients:
+                        result = run_clients(options.port, clients, options)
+                        result.update(mode=mode, workers=workers,
+                                      clients=clients)
+                        report['results'].append(result)
+                        print('{:8} workers={:<3} clients={:<4} '
+                              '{:10.0f} req/s  p50={}us p99={}us '
+                              'p999={}us'.format(
+                                  mode, workers, clients,
+                                  result['throughput'],
+                                  result['latency']['p50'],
+                                  result['latency']['p99'],
+                                  result['latency']['p999']),
+                              file=sys.stderr)
+                finally:
+                    stop_server(server)
+    finally:
+        shutil.rmtree(tmp)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
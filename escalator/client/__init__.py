@@ -1 +1,2 @@
 from .escalator import Escalator
+from .pipeline import PipelinedEscalator
@@ -0,0 +1,17 @@
+from . import protocol
+
+
+def cas_args(expected, new, pack=True):
+    # None stands for a missing key, it is not packed
+    if pack:
+        if expected is not None:
+            expected = protocol.msg.pack_arg(expected)
+        if new is not None:
+            new = protocol.msg.pack_arg(new)
+    return expected, new
+
+
+def cas_value(value, pack=True):
+    if value is None or not pack:
+        return value
+    return protocol.msg.unpack_msg(value)
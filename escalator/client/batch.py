@@ -2,18 +2,16 @@ from . import protocol
 
 
 class WriteBatch(object):
-    def __init__(self, db, transaction):
+    def __init__(self, db, transaction, durability=None):
         self.db = db
         self.transaction = transaction
+        self.durability = durability
         self.requests = []
 
     def write(self):
-        self.requests.insert(0, protocol.msg.format_request(protocol.cmd.BATCH,
-                                                            self.db.db_uid,
-                                                            self.transaction))
-        self.db.socket.send_multipart(self.requests)
-        protocol.msg.extract_response(self.db.socket.recv())
-        self.requests = []
+        requests, self.requests = self.requests, []
+        return self.db._request_parts(protocol.cmd.BATCH, requests,
+                                      self.transaction, self.durability)
 
     def __enter__(self):
         return self
@@ -25,10 +23,13 @@ class WriteBatch(object):
     def _request(self, cmd, *args):
         self.requests.append(protocol.msg.format_request(cmd, None, *args))
 
-    def put(self, key, value, pack=True):
+    def put(self, key, value, pack=True, ttl=None):
         if pack:
             value = protocol.msg.pack_arg(value)
-        self._request(protocol.cmd.PUT, key, value)
+        if ttl is None:
+            self._request(protocol.cmd.PUT, key, value)
+        else:
+            self._request(protocol.cmd.PUT, key, value, ttl)
 
     def delete(self, key):
         self._request(protocol.cmd.DELETE, key)
@@ -0,0 +1,120 @@
+import os
+from collections import deque
+from concurrent.futures import Future
+
+from . import protocol
+from .protocol.blob import (CHUNK_PREFIX, MAGIC, MANIFEST, NotABlob,
+                            chunk_key, pack_manifest, unpack_manifest)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def result(value):
+    return value.result() if isinstance(value, Future) else value
+
+
+class BlobReader(object):
+    def __init__(self, fetch, manifest, max_in_flight=1, release=None):
+        self.fetch = fetch
+        self.blob_id, self.size, self.nb_chunks, self.chunk_size = manifest
+        self.max_in_flight = max(1, max_in_flight)
+        self.release = release
+        self.next_chunk = 0
+        self.pending = deque()
+        self.buffer = b''
+        self.closed = False
+
+    def _fill(self):
+        while self.next_chunk < self.nb_chunks and \
+                len(self.pending) < self.max_in_flight:
+            self.pending.append(self.fetch(self.blob_id, self.next_chunk))
+            self.next_chunk += 1
+
+    def read_chunk(self):
+        if self.buffer:
+            data, self.buffer = self.buffer, b''
+            return data
+        self._fill()
+        if not self.pending:
+            return b''
+        data = result(self.pending.popleft())
+        self._fill()
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b''.join(iter(self.read_chunk, b''))
+        parts = []
+        while size > 0:
+            data = self.read_chunk()
+            if not data:
+                break
+            parts.append(data[:size])
+            self.buffer = data[size:]
+            size -= len(parts[-1])
+        return b''.join(parts)
+
+    def __iter__(self):
+        return iter(self.read_chunk, b'')
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            for future in self.pending:
+                result(future)
+            self.pending.clear()
+            if self.release is not None:
+                self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def put_stream(db, key, fileobj, chunk_size=CHUNK_SIZE, max_in_flight=1,
+               durability=None):
+    try:
+        previous = get_manifest(db, key)
+    except (protocol.status.KeyNotFound, NotABlob):
+        previous = None
+    blob_id = os.urandom(8)
+    pending = deque()
+    size = nb_chunks = 0
+    while True:
+        data = fileobj.read(chunk_size)
+        if not data:
+            break
+        while len(pending) >= max(1, max_in_flight):
+            result(pending.popleft())
+        pending.append(db.put(chunk_key(key, blob_id, nb_chunks), data,
+                              pack=False, durability=durability))
+        size += len(data)
+        nb_chunks += 1
+    for future in pending:
+        result(future)
+    result(db.put(key, pack_manifest(blob_id, size, nb_chunks, chunk_size),
+                  pack=False, durability=durability))
+    if previous is not None:
+        delete_chunks(db, key, previous, durability)
+    return size
+
+
+def get_manifest(db, key, snapshot=None):
+    kwargs = {'snapshot': snapshot} if snapshot is not None else {}
+    return unpack_manifest(result(db.get(key, pack=False, **kwargs)))
+
+
+def delete_chunks(db, key, manifest, durability=None):
+    blob_id, _, nb_chunks, _ = manifest
+    wb = db.write_batch(durability=durability)
+    for index in range(nb_chunks):
+        wb.delete(chunk_key(key, blob_id, index))
+    result(wb.write())
+
+
+def delete_stream(db, key, durability=None):
+    manifest = get_manifest(db, key)
+    result(db.delete(key, durability=durability))
+    delete_chunks(db, key, manifest, durability)
@@ -0,0 +1,23 @@
+from collections import namedtuple
+
+from . import protocol
+
+# position in the change log of a database, changes are read from there
+Position = namedtuple('Position', 'epoch sequence')
+
+# ops written together share their sequence
+Change = namedtuple('Change', 'sequence timestamp key value deleted')
+
+
+def decode(response, sequence, pack=True, tagged=True):
+    epoch, current, entries = response
+    changes = []
+    for sequence, timestamp, ops in entries:
+        for key, value in ops:
+            deleted = value is None
+            if not deleted:
+                value = protocol.codec.decode(value, tagged)
+                if pack:
+                    value = protocol.msg.unpack_msg(value)
+            changes.append(Change(sequence, timestamp, key, value, deleted))
+    return changes, Position(epoch, sequence), current
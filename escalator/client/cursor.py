@@ -0,0 +1,45 @@
+from . import protocol
+
+
+class Cursor(object):
+    def __init__(self, db, cursor_id, include_key, include_value,
+                 pack, batch_size):
+        self.db = db
+        self.cursor_id = cursor_id
+        self.include_key = include_key
+        self.include_value = include_value
+        self.pack = pack
+        self.batch_size = batch_size
+        self.exhausted = False
+
+    def next_batch(self, size=None):
+        if self.exhausted:
+            return []
+        if size is None:
+            size = self.batch_size
+        args, values = self.db._request_multi(protocol.cmd.ITER_NEXT,
+                                              self.cursor_id, size)
+        self.exhausted = args[0]
+        values = protocol.codec.decode_values(values, self.include_key,
+                                              self.include_value,
+                                              self.db.tagged)
+        if self.pack:
+            values = protocol.msg.unpack_values(values, self.include_key,
+                                                self.include_value)
+        return values
+
+    def close(self):
+        if not self.exhausted:
+            self.exhausted = True
+            self.db._request(protocol.cmd.ITER_CLOSE, self.cursor_id)
+
+    def __iter__(self):
+        while not self.exhausted:
+            for value in self.next_batch():
+                yield value
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -1,108 +1,312 @@
+from itertools import count
 from threading import Lock
 
 import zmq
 
+from . import atomic
+from . import blob
+from . import changelog
 from . import protocol
 from .batch import WriteBatch
+from .cursor import Cursor
+from .query import query_args
+from .snapshot import Snapshot
+from .watch import Watcher
 
 
 class Escalator(object):
     def __init__(self, db_name='default',
                  server='localhost', port=4224, transport='tcp', addr=None,
-                 create_db=False):
+                 create_db=False, durability=None, db_options=None,
+                 version=protocol.v2.VERSION, watch_port=None, direct=True):
         super(Escalator, self).__init__()
         self.db_uid = None
+        self.db_name = None
+        self.durability = durability
+        # requests are sent in version 1 until CONNECT negotiates more
+        self.max_version = version
+        self.version = 1
+        self.ids = count()
         self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.REQ)
+        self.front = self.context.socket(zmq.REQ)
         self.lock = Lock()
         if addr is None:
             addr = '{}://{}:{}'.format(transport, server, port)
-        self.socket.connect(addr)
+        self.front.connect(addr)
+        # requests to the database go to its shard once CONNECT gave it
+        self.direct = direct
+        self.socket = self.front
+        self.watch_addr = None
+        if watch_port is not None:
+            self.watch_addr = '{}://{}:{}'.format(transport, server,
+                                                  watch_port)
         if db_name is not None:
-            self.connect(db_name, create_db)
+            self.connect(db_name, create_db, db_options)
+
+    @property
+    def tagged(self):
+        # values travel in their stored encoding from version 2 on
+        return self.version >= protocol.v2.VERSION
 
     def _request(self, cmd, *args):
+        return self._request_parts(cmd, [], *args)
+
+    def _format_request(self, cmd, *args):
+        if self.version >= protocol.v2.VERSION:
+            return protocol.v2.format_request(cmd, self.db_uid,
+                                              next(self.ids) & 0xffffffff,
+                                              *args)
+        return protocol.msg.format_request(cmd, self.db_uid, *args)
+
+    def _request_parts(self, cmd, parts, *args):
         with self.lock:
-            self.socket.send(protocol.msg.format_request(cmd,
-                                                         self.db_uid,
-                                                         *args))
+            self.socket.send_multipart([self._format_request(cmd, *args)] +
+                                       parts, copy=False)
             return protocol.msg.extract_response(self.socket.recv())
 
+    def _request_front(self, cmd, *args):
+        # names are routed by the frontend of sharded servers
+        with self.lock:
+            self.front.send(self._format_request(cmd, *args))
+            return protocol.msg.extract_response(self.front.recv())
+
+    def _request_frames(self, cmd, *args):
+        with self.lock:
+            self.socket.send(self._format_request(cmd, *args))
+            frames = self.socket.recv_multipart(copy=False)
+        return (protocol.msg.extract_response(frames[0].bytes),
+                frames[1:])
+
     def _request_multi(self, cmd, *args):
         with self.lock:
-            self.socket.send(protocol.msg.format_request(cmd,
-                                                         self.db_uid,
-                                                         *args))
-            protocol.msg.extract_response(self.socket.recv())
+            self.socket.send(self._format_request(cmd, *args))
+            args = protocol.msg.extract_response(self.socket.recv())
             l = []
             while self.socket.get(zmq.RCVMORE):
                 l.append(protocol.msg.unpack_msg(self.socket.recv()))
-            return l
+            return args, l
 
-    def create(self, name):
-        self._request(protocol.cmd.CREATE, name)
+    def _connect_shard(self, endpoint):
+        if isinstance(endpoint, bytes):
+            endpoint = endpoint.decode()
+        with self.lock:
+            if self.socket is not self.front:
+                self.socket.close(linger=0)
+            self.socket = self.front
+            if endpoint is not None:
+                self.socket = self.context.socket(zmq.REQ)
+                self.socket.connect(endpoint)
 
-    def connect(self, name, create=False):
-        self.db_uid = self._request(protocol.cmd.CONNECT, name, create)[0]
+    def create(self, name, options=None):
+        self._request_front(protocol.cmd.CREATE, name, options)
 
-    def get(self, key, pack=True):
-        value = self._request(protocol.cmd.GET, key)[0]
+    def connect(self, name, create=False, options=None):
+        args = (name, create, options)
+        if self.max_version > 1:
+            args += (self.max_version,)
+        try:
+            resp = self._request_front(protocol.cmd.CONNECT, *args)
+        except protocol.status.InvalidArguments:
+            if self.max_version == 1:
+                raise
+            # servers predating version negotiation
+            self.max_version = 1
+            return self.connect(name, create, options)
+        self.db_uid = resp[0]
+        self.db_name = name
+        self.version = resp[1] if len(resp) > 1 else 1
+        self._connect_shard(resp[2] if len(resp) > 2 and self.direct
+                            else None)
+
+    def get(self, key, pack=True, snapshot=None, copy=True):
+        args, frames = self._request_frames(protocol.cmd.GET, key, snapshot,
+                                            True)
+        if not frames:
+            value = args[0]
+        elif pack or not copy:
+            value = frames[0].buffer
+        else:
+            value = frames[0].bytes
+        value = protocol.codec.decode(value, self.tagged)
         if pack:
             value = protocol.msg.unpack_msg(value)
         return value
 
-    def exists(self, key):
-        return self._request(protocol.cmd.EXISTS, key)[0]
+    def exists(self, key, snapshot=None):
+        return self._request(protocol.cmd.EXISTS, key, snapshot)[0]
 
-    def get_default(self, key, default=None, pack=True):
+    def get_default(self, key, default=None, pack=True, snapshot=None):
         try:
-            return self.get(key, pack=pack)
+            return self.get(key, pack=pack, snapshot=snapshot)
         except protocol.status.KeyNotFound:
             return default
 
-    def put(self, key, value, pack=True):
+    def get_many(self, keys, default=None, pack=True, snapshot=None):
+        values = self._request(protocol.cmd.MULTI_GET, list(keys), snapshot)
+        if pack:
+            return [default if value is None
+                    else protocol.msg.unpack_msg(
+                        protocol.codec.decode(value, self.tagged))
+                    for value in values]
+        return [default if value is None
+                else protocol.codec.decode(value, self.tagged)
+                for value in values]
+
+    def exists_many(self, keys, snapshot=None):
+        return self._request(protocol.cmd.MULTI_EXISTS, list(keys), snapshot)
+
+    def put(self, key, value, pack=True, durability=None, ttl=None):
         if pack:
             value = protocol.msg.pack_arg(value)
-        self._request(protocol.cmd.PUT, key, value)
+        # the TTL is only sent when given, for older servers
+        ttl = () if ttl is None else (ttl,)
+        if len(value) >= protocol.msg.RAW_THRESHOLD:
+            self._request_parts(protocol.cmd.PUT, [value], key, None,
+                                self._durability(durability), *ttl)
+        else:
+            self._request(protocol.cmd.PUT, key, value,
+                          self._durability(durability), *ttl)
 
-    def delete(self, key):
-        self._request(protocol.cmd.DELETE, key)
+    def delete(self, key, durability=None):
+        self._request(protocol.cmd.DELETE, key,
+                      self._durability(durability))
+
+    def incr(self, key, delta=1, durability=None):
+        return self._request(protocol.cmd.INCR, key, delta,
+                             self._durability(durability))[0]
+
+    def cas(self, key, expected, new, pack=True, durability=None):
+        swapped, value = self._request(protocol.cmd.CAS, key,
+                                       *atomic.cas_args(expected, new, pack),
+                                       self._durability(durability), pack)
+        return swapped, atomic.cas_value(value, pack)
 
     def range(self,
               prefix=None, start=None, stop=None,
               include_start=True, include_stop=False,
               include_key=True, include_value=True,
-              reverse=False, pack=True):
-        values = self._request_multi(protocol.cmd.RANGE,
-                                     prefix, start, stop,
-                                     include_start, include_stop,
-                                     include_key, include_value,
-                                     reverse)
-        if pack and include_value:
-            if include_key:
-                values = [[key, protocol.msg.unpack_msg(value)]
-                          for key, value in values]
-            else:
-                values = [protocol.msg.unpack_msg(value) for value in values]
-        return values
-
-    def write_batch(self, transaction=False):
-        return WriteBatch(self, transaction)
-
-
-if __name__ == '__main__':
-    from multiprocessing.pool import ThreadPool
-
-    k = 10000
-
-    def foo(w):
-        w += 1
-        client = Escalator()
-        for i in range(k):
-            client.put(str(w * k + i), str(i))
-
-        for i in range(k):
-            print(client.get(str(w * k + i)))
-
-    pool = ThreadPool()
-    pool.map(foo, range(5))
+              reverse=False, pack=True, snapshot=None,
+              where=None, fields=None):
+        return self.range_page(prefix, start, stop,
+                               include_start, include_stop,
+                               include_key, include_value,
+                               reverse, pack, None, None, snapshot,
+                               where, fields)[0]
+
+    def range_page(self,
+                   prefix=None, start=None, stop=None,
+                   include_start=True, include_stop=False,
+                   include_key=True, include_value=True,
+                   reverse=False, pack=True, limit=1000, token=None,
+                   snapshot=None, where=None, fields=None):
+        args, values = self._request_multi(protocol.cmd.RANGE,
+                                           prefix, start, stop,
+                                           include_start, include_stop,
+                                           include_key, include_value,
+                                           reverse, limit, token, snapshot,
+                                           *query_args(where, fields))
+        values = protocol.codec.decode_values(values,
+                                              include_key, include_value,
+                                              self.tagged)
+        if pack:
+            values = protocol.msg.unpack_values(values,
+                                                include_key, include_value)
+        return values, args[0]
+
+    def range_iter(self,
+                   prefix=None, start=None, stop=None,
+                   include_start=True, include_stop=False,
+                   include_key=True, include_value=True,
+                   reverse=False, pack=True, chunk_size=1000, snapshot=None,
+                   where=None, fields=None):
+        token = None
+        while True:
+            values, token = self.range_page(prefix, start, stop,
+                                            include_start, include_stop,
+                                            include_key, include_value,
+                                            reverse, pack, chunk_size, token,
+                                            snapshot, where, fields)
+            for value in values:
+                yield value
+            if token is None:
+                break
+
+    def iterator(self,
+                 prefix=None, start=None, stop=None,
+                 include_start=True, include_stop=False,
+                 include_key=True, include_value=True,
+                 reverse=False, pack=True, batch_size=1000):
+        cursor_id = self._request(protocol.cmd.ITER_OPEN,
+                                  prefix, start, stop,
+                                  include_start, include_stop,
+                                  include_key, include_value,
+                                  reverse)[0]
+        return Cursor(self, cursor_id, include_key, include_value,
+                      pack, batch_size)
+
+    def changes_since(self, position=None, limit=1000, pack=True):
+        epoch, sequence = position or (None, 0)
+        resp = self._request(protocol.cmd.CHANGES_SINCE, sequence, limit,
+                             epoch)
+        return changelog.decode(resp, sequence, pack, self.tagged)[:2]
+
+    def iter_changes(self, position=None, pack=True, chunk_size=1000):
+        epoch, sequence = position or (None, 0)
+        while True:
+            resp = self._request(protocol.cmd.CHANGES_SINCE, sequence,
+                                 chunk_size, epoch)
+            changes, (epoch, sequence), current = changelog.decode(
+                resp, sequence, pack, self.tagged)
+            for change in changes:
+                yield change
+            if sequence >= current:
+                break
+
+    def put_stream(self, key, fileobj, chunk_size=blob.CHUNK_SIZE,
+                   durability=None):
+        return blob.put_stream(self, key, fileobj, chunk_size, 1,
+                               self._durability(durability))
+
+    def get_stream(self, key):
+        snapshot = self.snapshot()
+        try:
+            manifest = blob.get_manifest(self, key, snapshot.snapshot_id)
+        except:
+            snapshot.release()
+            raise
+
+        def fetch(blob_id, index):
+            return self.get(blob.chunk_key(key, blob_id, index), pack=False,
+                            snapshot=snapshot.snapshot_id)
+        return blob.BlobReader(fetch, manifest, release=snapshot.release)
+
+    def delete_stream(self, key, durability=None):
+        blob.delete_stream(self, key, self._durability(durability))
+
+    def watch(self, prefix, callback, pack=True, addr=None):
+        if addr is None:
+            addr = self.watch_addr
+        if addr is None:
+            raise ValueError("No watch address, pass watch_port when "
+                             "creating the client")
+        name = self.db_name
+        if not isinstance(name, bytes):
+            name = name.encode()
+        watcher = Watcher(addr, name, prefix or b'', callback, pack)
+        watcher.start()
+        return watcher
+
+    def stats(self):
+        return self._request(protocol.cmd.STATS)[0]
+
+    def snapshot(self):
+        resp = self._request(protocol.cmd.SNAPSHOT_OPEN)
+        position = changelog.Position(*resp[1:]) if len(resp) > 1 else None
+        return Snapshot(self, resp[0], position)
+
+    def write_batch(self, transaction=False, durability=None):
+        return WriteBatch(self, transaction, self._durability(durability))
+
+    def _durability(self, durability):
+        return self.durability if durability is None else durability
+
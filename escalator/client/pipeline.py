@@ -0,0 +1,307 @@
+import struct
+from concurrent.futures import Future
+from itertools import count
+from threading import Lock, Thread
+
+import zmq
+
+from . import atomic
+from . import blob
+from . import changelog
+from . import protocol
+from .batch import WriteBatch
+from .query import query_args
+
+
+def _response(frames):
+    return protocol.msg.extract_response(frames[0].bytes)
+
+
+def _multi_response(frames):
+    return (protocol.msg.extract_response(frames[0].bytes),
+            [protocol.msg.unpack_msg(frame.buffer) for frame in frames[1:]])
+
+
+class PipelinedEscalator(object):
+    def __init__(self, db_name='default',
+                 server='localhost', port=4224, transport='tcp', addr=None,
+                 create_db=False, durability=None, db_options=None,
+                 version=protocol.v2.VERSION, direct=True):
+        super(PipelinedEscalator, self).__init__()
+        self.db_uid = None
+        self.durability = durability
+        self.max_version = version
+        self.version = 1
+        self.context = zmq.Context()
+        if addr is None:
+            addr = '{}://{}:{}'.format(transport, server, port)
+        self.addr = addr
+        # requests to the database go to its shard once CONNECT gave it
+        self.direct = direct
+        self.endpoint = b''
+        self.pending = {}
+        self.error = None
+        self.ids = count()
+        self.lock = Lock()
+
+        queue_uri = 'inproc://escalator-pipeline-{}'.format(id(self))
+        self.queue = self.context.socket(zmq.PULL)
+        self.queue.bind(queue_uri)
+        self.sender = self.context.socket(zmq.PUSH)
+        self.sender.connect(queue_uri)
+
+        self.thread = Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+        if db_name is not None:
+            try:
+                self.connect(db_name, create_db, db_options).result()
+            except protocol.status.InvalidArguments:
+                if self.max_version == 1:
+                    raise
+                # servers predating version negotiation
+                self.max_version = 1
+                self.connect(db_name, create_db, db_options).result()
+
+    @property
+    def tagged(self):
+        # values travel in their stored encoding from version 2 on
+        return self.version >= protocol.v2.VERSION
+
+    def _run(self):
+        socket = self.context.socket(zmq.DEALER)
+        socket.connect(self.addr)
+        # requests are prefixed by the shard they go to, or by b'' for the
+        # address given
+        sockets = {b'': socket}
+        error = ConnectionError("Pipeline closed")
+        try:
+            self._serve(sockets)
+        except Exception as e:
+            error = ConnectionError("Pipeline I/O failed: {!r}".format(e))
+        finally:
+            for socket in sockets.values():
+                socket.close(linger=0)
+            self.queue.close()
+            # nothing answers the requests left, nor the ones to come
+            with self.lock:
+                self.error = error
+                pending, self.pending = self.pending, {}
+            for future, _ in pending.values():
+                future.set_exception(error)
+
+    def _serve(self, sockets):
+        poller = zmq.Poller()
+        poller.register(self.queue, zmq.POLLIN)
+        poller.register(sockets[b''], zmq.POLLIN)
+
+        while True:
+            for s, _ in poller.poll():
+                if s is self.queue:
+                    msg = self.queue.recv_multipart(copy=False)
+                    if len(msg) == 1:
+                        return
+                    target = msg[0].bytes
+                    if target not in sockets:
+                        sockets[target] = self.context.socket(zmq.DEALER)
+                        sockets[target].connect(target.decode())
+                        poller.register(sockets[target], zmq.POLLIN)
+                    sockets[target].send_multipart(msg[1:], copy=False)
+                    continue
+                msg = s.recv_multipart(copy=False)
+                try:
+                    if len(msg[0]):
+                        # version 1, the request id is in the envelope
+                        request_id, = struct.unpack('!I', msg[0].bytes)
+                        frames = msg[2:]
+                    else:
+                        frames = msg[1:]
+                        request_id = protocol.v2.response_id(
+                            frames[0].bytes)
+                    future, parse = self.pending.pop(request_id)
+                except (IndexError, KeyError, struct.error):
+                    # malformed, or answering nothing pending
+                    continue
+                try:
+                    future.set_result(parse(frames))
+                except Exception as e:
+                    future.set_exception(e)
+
+    def _request(self, cmd, *args, **kwargs):
+        return self._request_parts(cmd, [], *args, **kwargs)
+
+    def _request_multi(self, cmd, *args, **kwargs):
+        kwargs.setdefault('parse', _multi_response)
+        return self._request_parts(cmd, [], *args, **kwargs)
+
+    def _request_parts(self, cmd, parts, *args, **kwargs):
+        future = Future()
+        with self.lock:
+            if self.error is not None:
+                future.set_exception(self.error)
+                return future
+            request_id = next(self.ids) & 0xffffffff
+            self.pending[request_id] = (future, kwargs.get('parse',
+                                                           _response))
+            if self.version >= protocol.v2.VERSION:
+                msg = [b'', protocol.v2.format_request(cmd, self.db_uid,
+                                                       request_id, *args)]
+            else:
+                msg = [struct.pack('!I', request_id), b'',
+                       protocol.msg.format_request(cmd, self.db_uid, *args)]
+            # names are routed by the frontend of sharded servers
+            target = b'' if cmd in (protocol.cmd.CREATE,
+                                    protocol.cmd.CONNECT) else self.endpoint
+            self.sender.send_multipart([target] + msg + parts, copy=False)
+        return future
+
+    def close(self):
+        with self.lock:
+            if self.error is None:
+                self.sender.send(b'')
+            self.sender.close()
+        self.thread.join()
+        self.context.term()
+
+    def create(self, name, options=None):
+        return self._request(protocol.cmd.CREATE, name, options)
+
+    def connect(self, name, create=False, options=None):
+        def parse(frames):
+            resp = _response(frames)
+            self.db_uid = resp[0]
+            self.version = resp[1] if len(resp) > 1 else 1
+            self.endpoint = b''
+            if len(resp) > 2 and self.direct:
+                self.endpoint = resp[2]
+                if not isinstance(self.endpoint, bytes):
+                    self.endpoint = self.endpoint.encode()
+            return self.db_uid
+        args = (name, create, options)
+        if self.max_version > 1:
+            args += (self.max_version,)
+        return self._request(protocol.cmd.CONNECT, *args, parse=parse)
+
+    def get(self, key, pack=True, copy=True, snapshot=None):
+        def parse(frames):
+            if len(frames) == 1:
+                value = _response(frames)[0]
+            else:
+                _response(frames)
+                value = frames[1].buffer if pack or not copy \
+                    else frames[1].bytes
+            value = protocol.codec.decode(value, self.tagged)
+            return protocol.msg.unpack_msg(value) if pack else value
+        return self._request(protocol.cmd.GET, key, snapshot, True,
+                             parse=parse)
+
+    def exists(self, key):
+        return self._request(protocol.cmd.EXISTS, key,
+                             parse=lambda frames: _response(frames)[0])
+
+    def get_many(self, keys, default=None, pack=True):
+        def parse(frames):
+            values = [None if value is None
+                      else protocol.codec.decode(value, self.tagged)
+                      for value in _response(frames)]
+            return [default if value is None
+                    else protocol.msg.unpack_msg(value) if pack else value
+                    for value in values]
+        return self._request(protocol.cmd.MULTI_GET, list(keys), parse=parse)
+
+    def exists_many(self, keys):
+        return self._request(protocol.cmd.MULTI_EXISTS, list(keys))
+
+    def put(self, key, value, pack=True, durability=None, ttl=None):
+        if pack:
+            value = protocol.msg.pack_arg(value)
+        ttl = () if ttl is None else (ttl,)
+        if len(value) >= protocol.msg.RAW_THRESHOLD:
+            return self._request_parts(protocol.cmd.PUT, [value], key, None,
+                                       self._durability(durability), *ttl)
+        return self._request(protocol.cmd.PUT, key, value,
+                             self._durability(durability), *ttl)
+
+    def delete(self, key, durability=None):
+        return self._request(protocol.cmd.DELETE, key,
+                             self._durability(durability))
+
+    def incr(self, key, delta=1, durability=None):
+        return self._request(protocol.cmd.INCR, key, delta,
+                             self._durability(durability),
+                             parse=lambda frames: _response(frames)[0])
+
+    def cas(self, key, expected, new, pack=True, durability=None):
+        def parse(frames):
+            swapped, value = _response(frames)
+            return swapped, atomic.cas_value(value, pack)
+        return self._request(protocol.cmd.CAS, key,
+                             *atomic.cas_args(expected, new, pack),
+                             self._durability(durability), pack, parse=parse)
+
+    def range_page(self,
+                   prefix=None, start=None, stop=None,
+                   include_start=True, include_stop=False,
+                   include_key=True, include_value=True,
+                   reverse=False, pack=True, limit=1000, token=None,
+                   where=None, fields=None):
+        def parse(frames):
+            args, values = _multi_response(frames)
+            values = protocol.codec.decode_values(values,
+                                                  include_key, include_value,
+                                                  self.tagged)
+            if pack:
+                values = protocol.msg.unpack_values(values,
+                                                    include_key, include_value)
+            return values, args[0]
+        return self._request_multi(protocol.cmd.RANGE,
+                                   prefix, start, stop,
+                                   include_start, include_stop,
+                                   include_key, include_value,
+                                   reverse, limit, token, None,
+                                   *query_args(where, fields), parse=parse)
+
+    def changes_since(self, position=None, limit=1000, pack=True):
+        epoch, sequence = position or (None, 0)
+        return self._request(
+            protocol.cmd.CHANGES_SINCE, sequence, limit, epoch,
+            parse=lambda frames: changelog.decode(_response(frames),
+                                                  sequence, pack,
+                                                  self.tagged)[:2])
+
+    def put_stream(self, key, fileobj, chunk_size=blob.CHUNK_SIZE,
+                   max_in_flight=4, durability=None):
+        return blob.put_stream(self, key, fileobj, chunk_size, max_in_flight,
+                               self._durability(durability))
+
+    def get_stream(self, key, max_in_flight=4):
+        # read from a snapshot, as overwrites delete the previous chunks
+        snapshot_id = self._request(protocol.cmd.SNAPSHOT_OPEN).result()[0]
+
+        def release():
+            self._request(protocol.cmd.SNAPSHOT_RELEASE,
+                          snapshot_id).result()
+        try:
+            manifest = blob.get_manifest(self, key, snapshot_id)
+        except:
+            release()
+            raise
+
+        def fetch(blob_id, index):
+            return self.get(blob.chunk_key(key, blob_id, index), pack=False,
+                            snapshot=snapshot_id)
+        return blob.BlobReader(fetch, manifest, max_in_flight, release)
+
+    def delete_stream(self, key, durability=None):
+        blob.delete_stream(self, key, self._durability(durability))
+
+    def stats(self):
+        return self._request(protocol.cmd.STATS,
+                             parse=lambda frames: _response(frames)[0])
+
+    def write_batch(self, transaction=False, durability=None):
+        return WriteBatch(self, transaction, self._durability(durability))
+
+    def _durability(self, durability):
+        return self.durability if durability is None else durability
@@ -0,0 +1,8 @@
+def query_args(where=None, fields=None):
+    # where is a list of (field, operator, operand) conditions on the
+    # fields of msgpack maps, operators are ==, !=, <, <=, >, >= and in.
+    # Only sent when given, for older servers.
+    if where is None and fields is None:
+        return ()
+    return ([list(condition) for condition in where or ()],
+            None if fields is None else list(fields))
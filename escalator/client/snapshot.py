@@ -0,0 +1,45 @@
+from . import protocol
+
+
+class Snapshot(object):
+    def __init__(self, db, snapshot_id, position=None):
+        self.db = db
+        self.snapshot_id = snapshot_id
+        # where to read the changes made after the snapshot from, when the
+        # database keeps a change log
+        self.position = position
+
+    def get(self, key, pack=True):
+        return self.db.get(key, pack, self.snapshot_id)
+
+    def get_default(self, key, default=None, pack=True):
+        return self.db.get_default(key, default, pack, self.snapshot_id)
+
+    def exists(self, key):
+        return self.db.exists(key, self.snapshot_id)
+
+    def get_many(self, keys, default=None, pack=True):
+        return self.db.get_many(keys, default, pack, self.snapshot_id)
+
+    def exists_many(self, keys):
+        return self.db.exists_many(keys, self.snapshot_id)
+
+    def range(self, *args, **kwargs):
+        return self.db.range(*args, snapshot=self.snapshot_id, **kwargs)
+
+    def range_page(self, *args, **kwargs):
+        return self.db.range_page(*args, snapshot=self.snapshot_id, **kwargs)
+
+    def range_iter(self, *args, **kwargs):
+        return self.db.range_iter(*args, snapshot=self.snapshot_id, **kwargs)
+
+    def release(self):
+        if self.snapshot_id is not None:
+            self.db._request(protocol.cmd.SNAPSHOT_RELEASE, self.snapshot_id)
+            self.snapshot_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.release()
@@ -0,0 +1,71 @@
+import struct
+from collections import namedtuple
+from threading import Thread
+
+import zmq
+
+from . import protocol
+
+HEADER = struct.Struct('!QQc')
+
+PUT = b'p'
+DELETE = b'd'
+
+# dropped is the number of changes missed since the previous event received
+# by this watcher. Watchers of a whole database receive all its changes and
+# see every gap in their sequence, including the events the server's PUB
+# socket discarded for a subscriber too slow to keep up. Prefix watchers
+# only receive some of them, they only count the changes the server could
+# not queue for publication and miss those the PUB socket discarded.
+Event = namedtuple('Event', 'key value deleted sequence dropped')
+
+
+class Watcher(Thread):
+
+    def __init__(self, addr, name, prefix, callback, pack=True):
+        super(Watcher, self).__init__()
+        self.daemon = True
+
+        self.context = zmq.Context.instance()
+        self.socket = self.context.socket(zmq.SUB)
+        self.socket.connect(addr)
+        self.topic = name + b'\x00'
+        self.socket.setsockopt(zmq.SUBSCRIBE, self.topic + prefix)
+        self.callback = callback
+        self.pack = pack
+        self.whole = not prefix
+        self.sequence = None
+        self.dropped = 0
+        self.closing = False
+
+    def run(self):
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        while not self.closing:
+            if not poller.poll(100):
+                continue
+            msg = self.socket.recv_multipart()
+            sequence, dropped, op = HEADER.unpack(msg[1])
+            value = None
+            if len(msg) > 2:
+                value = protocol.codec.decode(msg[2])
+                if self.pack:
+                    value = protocol.msg.unpack_msg(value)
+            lost = max(0, dropped - self.dropped)
+            self.dropped = max(dropped, self.dropped)
+            if self.whole and self.sequence is not None:
+                lost = max(0, sequence - self.sequence - 1)
+            self.sequence = sequence
+            self.callback(Event(msg[0][len(self.topic):], value, op == DELETE,
+                                sequence, lost))
+        self.socket.close(linger=0)
+
+    def close(self):
+        self.closing = True
+        self.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
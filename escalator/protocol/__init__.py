@@ -1,3 +1,8 @@
+from . import blob
 from . import cmd
+from . import codec
+from . import durability
+from . import keyspace
 from . import msg
 from . import status
+from . import v2
@@ -0,0 +1,38 @@
+import struct
+
+from .keyspace import reserved
+
+# chunks live in the keyspace reserved by the server so that they do not
+# show up in ranges, the manifest stored under the blob's key points to them
+CHUNK_PREFIX = reserved(b'blob')
+# after the key: a separator, the id of the blob and the index of the chunk
+CHUNK_SUFFIX = struct.Struct('!c8sQ')
+
+MANIFEST = struct.Struct('!4s8sQQQ')
+MAGIC = b'BLOB'
+
+
+class NotABlob(Exception):
+    pass
+
+
+def chunk_key(key, blob_id, index):
+    return CHUNK_PREFIX + key + CHUNK_SUFFIX.pack(b'\x00', blob_id, index)
+
+
+def split_chunk_key(chunk):
+    # keys may contain anything, the suffix has a fixed size
+    offset = len(chunk) - CHUNK_SUFFIX.size
+    _, blob_id, index = CHUNK_SUFFIX.unpack_from(chunk, offset)
+    return chunk[len(CHUNK_PREFIX):offset], blob_id, index
+
+
+def pack_manifest(blob_id, size, nb_chunks, chunk_size):
+    return MANIFEST.pack(MAGIC, blob_id, size, nb_chunks, chunk_size)
+
+
+def unpack_manifest(value):
+    if value is None or len(value) != MANIFEST.size or \
+       value[:4] != MAGIC:
+        raise NotABlob(value)
+    return MANIFEST.unpack(value)[1:]
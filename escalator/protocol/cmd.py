@@ -20,3 +20,14 @@ PUT = command('PUT', b'\x05')
 DELETE = command('DELETE', b'\x06')
 RANGE = command('RANGE', b'\x07')
 BATCH = command('BATCH', b'\x08')
+ITER_OPEN = command('ITER_OPEN', b'\x09')
+ITER_NEXT = command('ITER_NEXT', b'\x0a')
+ITER_CLOSE = command('ITER_CLOSE', b'\x0b')
+MULTI_GET = command('MULTI_GET', b'\x0c')
+MULTI_EXISTS = command('MULTI_EXISTS', b'\x0d')
+SNAPSHOT_OPEN = command('SNAPSHOT_OPEN', b'\x0e')
+SNAPSHOT_RELEASE = command('SNAPSHOT_RELEASE', b'\x0f')
+STATS = command('STATS', b'\x10')
+CHANGES_SINCE = command('CHANGES_SINCE', b'\x11')
+INCR = command('INCR', b'\x12')
+CAS = command('CAS', b'\x13')
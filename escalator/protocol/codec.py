@@ -0,0 +1,35 @@
+import zlib
+
+# stored values starting with TAG are encoded: the next byte is the codec
+# and the rest the encoded value. msgpack never produces TAG, raw values
+# which happen to start with it are stored with the RAW codec.
+TAG = b'\xc1'
+
+RAW = 0
+ZLIB = 1
+
+# 'snappy' is LevelDB's own block compression, values are left untouched
+CODECS = ('none', 'snappy', 'zlib')
+
+
+def tag(codec, data):
+    return TAG + bytes((codec,)) + data
+
+
+# values travel in their stored encoding to clients speaking version 2,
+# the server decodes them for older clients
+def decode(value, tagged=True):
+    if not tagged or value[:1] != TAG:
+        return value
+    if value[1] == ZLIB:
+        return zlib.decompress(value[2:])
+    return bytes(value[2:])
+
+
+def decode_values(values, include_key=True, include_value=True,
+                  tagged=True):
+    if not include_value or not tagged:
+        return values
+    if include_key:
+        return [[key, decode(value)] for key, value in values]
+    return [decode(value) for value in values]
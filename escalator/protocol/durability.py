@@ -0,0 +1,5 @@
+NONE = 0
+PERIODIC = 1
+SYNC = 2
+
+LEVELS = (NONE, PERIODIC, SYNC)
@@ -0,0 +1,20 @@
+def prefix_end(prefix):
+    prefix = prefix.rstrip(b'\xff')
+    if not prefix:
+        return None
+    return prefix[:-1] + bytes((prefix[-1] + 1,))
+
+
+# keys kept next to the data of a database, by the server or by the clients
+# for their own bookkeeping. They never show up in ranges, iterators, change
+# logs or watches.
+RESERVED = b'\xff\xffescalator\x00'
+RESERVED_END = prefix_end(RESERVED)
+
+
+def reserved(name):
+    return RESERVED + name + b'\x00'
+
+
+def is_reserved(key):
+    return RESERVED <= key < RESERVED_END
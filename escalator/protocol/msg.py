@@ -1,6 +1,11 @@
 import msgpack
 
 from . import status as protocol_status
+from . import v2
+
+# values at least this large travel in their own raw frame, next to the
+# request or response, instead of being msgpacked inside it
+RAW_THRESHOLD = 64 * 1024
 
 
 def pack_arg(arg):
@@ -15,13 +20,36 @@ def unpack_msg(packed):
     return msgpack.unpackb(packed)
 
 
+def unpack_values(values, include_key=True, include_value=True):
+    if not include_value:
+        return values
+    if include_key:
+        return [[key, unpack_msg(value)] for key, value in values]
+    return [unpack_msg(value) for value in values]
+
+
 def format_request(cmd, uid, *args):
     return pack_msg(cmd, uid, args)
 
 
+class Response(object):
+    __slots__ = ('status', 'args')
+
+    def __init__(self, status, args):
+        self.status = status
+        self.args = args
+
+
+# responses are encoded by the transport, in the version of the request
 def format_response(*args, **kwargs):
-    status = kwargs.get('status', protocol_status.OK)
-    return pack_msg(status.code, args)
+    return Response(kwargs.get('status', protocol_status.OK), args)
+
+
+def pack_response(response, request_id=None, flags=0):
+    if request_id is None:
+        return pack_msg(response.status.code, response.args)
+    return v2.format_response(response.status.code, response.args,
+                              request_id, flags)
 
 
 def extract_request(msg):
@@ -29,7 +57,18 @@ def extract_request(msg):
     return cmd, uid, args
 
 
+def extract_header(msg):
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(msg)
+    unpacker.read_array_header()
+    cmd = unpacker.unpack()
+    uid = unpacker.unpack()
+    return cmd, uid, unpacker
+
+
 def extract_response(msg):
+    if v2.is_v2(msg):
+        return v2.extract_response(msg)[1]
     status_code, args = unpack_msg(msg)
     status = protocol_status.Status.get(status_code)
     if status.exception is not None:
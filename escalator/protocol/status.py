@@ -64,3 +64,57 @@ class Error(Exception):
     def __init__(self):
         Exception.__init__(self, 'An error occurred')
 ERROR = new_status('ERROR', Error)
+
+
+class CursorNotFound(KeyError):
+    def __init__(self, cursor):
+        KeyError.__init__(self, 'No cursor {} opened'.format(repr(cursor)))
+CURSOR_NOT_FOUND = new_status('CURSOR_NOT_FOUND', CursorNotFound)
+
+
+class TooManyCursors(Exception):
+    def __init__(self, limit):
+        Exception.__init__(self, 'Too many cursors opened on database '
+                           '(limit is {})'.format(limit))
+TOO_MANY_CURSORS = new_status('TOO_MANY_CURSORS', TooManyCursors)
+
+
+class SnapshotNotFound(KeyError):
+    def __init__(self, snapshot):
+        KeyError.__init__(self, 'No snapshot {} opened'.format(repr(snapshot)))
+SNAPSHOT_NOT_FOUND = new_status('SNAPSHOT_NOT_FOUND', SnapshotNotFound)
+
+
+class TooManySnapshots(Exception):
+    def __init__(self, limit):
+        Exception.__init__(self, 'Too many snapshots opened on database '
+                           '(limit is {})'.format(limit))
+TOO_MANY_SNAPSHOTS = new_status('TOO_MANY_SNAPSHOTS', TooManySnapshots)
+
+
+class ReadOnly(Exception):
+    def __init__(self, cmd):
+        Exception.__init__(self, 'Command {} refused by a read-only replica'.
+                           format(protocol_cmd.get_command(cmd)))
+READ_ONLY = new_status('READ_ONLY', ReadOnly)
+
+
+class NoChangelog(Exception):
+    def __init__(self, name):
+        Exception.__init__(self, 'Database {} keeps no change log'.
+                           format(repr(name)))
+NO_CHANGELOG = new_status('NO_CHANGELOG', NoChangelog)
+
+
+class ChangesUnavailable(KeyError):
+    def __init__(self, sequence):
+        KeyError.__init__(self, 'Changes following {} are no longer '
+                          'available'.format(sequence))
+CHANGES_UNAVAILABLE = new_status('CHANGES_UNAVAILABLE', ChangesUnavailable)
+
+
+class NotAnInteger(ValueError):
+    def __init__(self, key):
+        ValueError.__init__(self, 'Value of key {} is not an integer'.
+                            format(repr(key)))
+NOT_AN_INTEGER = new_status('NOT_AN_INTEGER', NotAnInteger)
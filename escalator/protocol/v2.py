@@ -0,0 +1,118 @@
+import struct
+
+import msgpack
+
+from . import status as protocol_status
+
+VERSION = 2
+
+# version, command, flags, database uid (-1 if none), request id
+REQUEST = struct.Struct('!BcBqI')
+# version, status, flags, request id
+RESPONSE = struct.Struct('!BBBI')
+
+# the arguments following the header are a msgpack array instead of typed
+# length-prefixed fields. The compiled msgpack beats encoding fields in
+# Python, the pure Python fallback does not. Responses use the encoding of
+# their request.
+PACKED_ARGS = 0x01
+DEFAULT_FLAGS = 0 if msgpack.Packer.__module__ == 'msgpack.fallback' \
+    else PACKED_ARGS
+
+# types of the typed fields
+NONE = 0
+FALSE = 1
+TRUE = 2
+INT = 3
+BYTES = 4
+PACKED = 5
+
+_TAGS = {None: bytes((NONE,)), False: bytes((FALSE,)), True: bytes((TRUE,))}
+_INT = struct.Struct('!Bq')
+_SIZE = struct.Struct('!BI')
+_INT_VALUE = struct.Struct('!q')
+_SIZE_VALUE = struct.Struct('!I')
+INT_MIN = -2 ** 63
+INT_MAX = 2 ** 63 - 1
+
+
+def is_v2(msg):
+    return msg[:1] == b'\x02'
+
+
+def pack_args(args, flags=0):
+    if flags & PACKED_ARGS:
+        return msgpack.packb(args)
+    out = []
+    for arg in args:
+        if arg is None or arg is True or arg is False:
+            out.append(_TAGS[arg])
+        elif isinstance(arg, bytes):
+            out.append(_SIZE.pack(BYTES, len(arg)))
+            out.append(arg)
+        elif isinstance(arg, int) and INT_MIN <= arg <= INT_MAX:
+            out.append(_INT.pack(INT, arg))
+        else:
+            packed = msgpack.packb(arg)
+            out.append(_SIZE.pack(PACKED, len(packed)))
+            out.append(packed)
+    return b''.join(out)
+
+
+def unpack_args(msg, offset, flags=0):
+    if flags & PACKED_ARGS:
+        return msgpack.unpackb(memoryview(msg)[offset:])
+    args = []
+    end = len(msg)
+    while offset < end:
+        tag = msg[offset]
+        offset += 1
+        if tag == BYTES or tag == PACKED:
+            size, = _SIZE_VALUE.unpack_from(msg, offset)
+            offset += 4
+            value = msg[offset:offset + size]
+            offset += size
+            args.append(value if tag == BYTES else msgpack.unpackb(value))
+        elif tag == INT:
+            args.append(_INT_VALUE.unpack_from(msg, offset)[0])
+            offset += 8
+        elif tag == NONE:
+            args.append(None)
+        else:
+            args.append(tag == TRUE)
+    return args
+
+
+def format_request(cmd, uid, request_id, *args, **kwargs):
+    flags = kwargs.get('flags', DEFAULT_FLAGS)
+    return REQUEST.pack(VERSION, cmd, flags, -1 if uid is None else uid,
+                        request_id) + pack_args(args, flags)
+
+
+def extract_header(msg):
+    _, cmd, flags, uid, request_id = REQUEST.unpack_from(msg)
+    return cmd, None if uid < 0 else uid, request_id, flags
+
+
+def extract_request(msg):
+    cmd, uid, request_id, flags = extract_header(msg)
+    return cmd, uid, request_id, flags, unpack_args(msg, REQUEST.size,
+                                                    flags)
+
+
+def format_response(status_code, args, request_id, flags=0):
+    return RESPONSE.pack(VERSION, status_code, flags, request_id) + \
+        pack_args(args, flags)
+
+
+def response_id(msg):
+    return RESPONSE.unpack_from(msg)[3]
+
+
+def extract_response(msg):
+    _, status_code, flags, request_id = RESPONSE.unpack_from(msg)
+    args = unpack_args(msg, RESPONSE.size, flags)
+    status = protocol_status.Status.get(status_code)
+    if status.exception is not None:
+        raise status.exception(*args)
+    return request_id, args
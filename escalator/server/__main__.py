@@ -1,32 +1,258 @@
+import argparse
+import multiprocessing
+
 import zmq
+import zmq.devices
 
+from . import protocol
 from .databases import Databases
+from .replication import Replica, Replicator
+from .router import Router
+from .shards import (Frontend, shard_uri, shard_watch_uri, start_shards,
+                     start_watch_proxy)
 from .worker import Worker
 
-context = zmq.Context()
+parser = argparse.ArgumentParser(prog='escalator.server')
+parser.add_argument('--mode',
+                    choices=('proxy', 'inproc', 'router', 'sharded'),
+                    default='proxy',
+                    help="'proxy': QUEUE device in front of REP worker "
+                    "threads, 'inproc': same but the device runs in the "
+                    "server process and talks to the workers over inproc, "
+                    "'router': single ROUTER socket served by an "
+                    "event loop, 'sharded': databases spread over router "
+                    "processes behind a routing frontend")
+parser.add_argument('--port', type=int, default=4224)
+parser.add_argument('--workers', type=int, default=8,
+                    help="worker threads (executor threads in router mode)")
+parser.add_argument('--shards', type=int,
+                    default=multiprocessing.cpu_count(),
+                    help="number of processes in sharded mode")
+parser.add_argument('--shard-host', metavar='HOST',
+                    help="in sharded mode, expose the shards on all "
+                    "interfaces and have clients talk to the shard of their "
+                    "database at HOST instead of through the frontend")
+parser.add_argument('--dbs', default='dbs', help="databases directory")
+parser.add_argument('--cursor-timeout', type=float, default=60,
+                    help="seconds after which an idle cursor is closed")
+parser.add_argument('--max-cursors', type=int, default=64,
+                    help="maximum number of open cursors per database")
+parser.add_argument('--cache-size', type=int, default=0,
+                    help="size in bytes of each database's read cache "
+                    "(0 disables it)")
+parser.add_argument('--bloom-error-rate', type=float, default=0,
+                    help="false positive rate of the per-database bloom "
+                    "filters used to answer misses (0 disables them)")
+parser.add_argument('--max-open-dbs', type=int, default=0,
+                    help="maximum number of simultaneously open databases, "
+                    "idle ones are closed and transparently reopened "
+                    "(0 means no limit)")
+parser.add_argument('--group-commit-window', type=float, default=0,
+                    help="seconds during which concurrent writes to a "
+                    "database are gathered into one batch (0 disables "
+                    "group commit)")
+parser.add_argument('--group-commit-size', type=int, default=256,
+                    help="number of operations that commits a group before "
+                    "the end of its window")
+parser.add_argument('--durability', choices=('none', 'periodic', 'sync'),
+                    default='none',
+                    help="durability of the writes to databases which do "
+                    "not define their own: 'none' leaves flushing to the "
+                    "OS, 'periodic' syncs every --sync-interval seconds, "
+                    "'sync' syncs before acknowledging (grouped with "
+                    "--group-commit-window)")
+parser.add_argument('--sync-interval', type=float, default=1,
+                    help="seconds between syncs of databases written with "
+                    "periodic durability")
+parser.add_argument('--snapshot-timeout', type=float, default=300,
+                    help="seconds after which an unused snapshot is "
+                    "released")
+parser.add_argument('--max-snapshots', type=int, default=64,
+                    help="maximum number of open snapshots per database")
+parser.add_argument('--codec', choices=protocol.codec.CODECS,
+                    default='snappy',
+                    help="compression of databases which do not define "
+                    "their own: 'snappy' is LevelDB's block compression, "
+                    "'zlib' compresses each value above "
+                    "--compression-threshold bytes, on disk and on the wire")
+parser.add_argument('--compression-level', type=int, default=6,
+                    help="zlib compression level")
+parser.add_argument('--compression-threshold', type=int, default=1024,
+                    help="size in bytes from which values are compressed "
+                    "with zlib")
+parser.add_argument('--watch-port', type=int,
+                    help="publish the changes made to the databases on this "
+                    "port (disabled by default)")
+parser.add_argument('--watch-values', action='store_true',
+                    help="include the new values in published changes")
+parser.add_argument('--watch-buffer', type=int, default=1000,
+                    help="number of changes buffered for publication and "
+                    "per subscriber, further changes are dropped instead of "
+                    "slowing writers down. Watchers of a whole database see "
+                    "all the changes they missed, prefix watchers only "
+                    "those dropped before the per subscriber buffer")
+parser.add_argument('--replication-port', type=int,
+                    help="serve the changes made to the databases to "
+                    "replicas on this port (disabled by default), the "
+                    "change log then applies the writes to each database "
+                    "one at a time, concurrent synced ones sharing an fsync")
+parser.add_argument('--replication-log-size', type=int, default=100000,
+                    help="number of writes kept in memory per database for "
+                    "replicas, older ones are read from the persistent "
+                    "change log if any, replicas further behind catch up "
+                    "from a snapshot")
+parser.add_argument('--replication-log-bytes', type=int,
+                    default=64 * 1024 * 1024,
+                    help="maximum size in bytes of the writes kept in memory "
+                    "per database for replicas")
+parser.add_argument('--changelog-retention', type=int, default=0,
+                    help="number of changes kept on disk per database, "
+                    "served by CHANGES_SINCE and to replicas (0 disables "
+                    "the persistent change log), writes are then applied "
+                    "as with --replication-port")
+parser.add_argument('--expiry-interval', type=float, default=1,
+                    help="seconds between two deletions of the keys whose "
+                    "TTL expired, expired keys are hidden from GET until "
+                    "then")
+parser.add_argument('--expiry-batch-size', type=int, default=1000,
+                    help="number of expired keys deleted per write batch")
+parser.add_argument('--blob-sweep-interval', type=float, default=300,
+                    help="seconds between two deletions of the chunks of "
+                    "the blobs no longer referenced by their key, after a "
+                    "put or delete over them or a failed upload (0 disables "
+                    "them)")
+parser.add_argument('--blob-sweep-grace', type=float, default=3600,
+                    help="seconds during which the chunks of a blob are kept "
+                    "once found unreferenced, uploads taking longer lose "
+                    "their chunks")
+parser.add_argument('--replica-of', metavar='HOST:PORT',
+                    help="run as a read-only replica of the primary whose "
+                    "--replication-port is given")
+options = parser.parse_args()
+if options.replication_port is not None and options.replica_of:
+    parser.error("a replica can not be a primary")
+if options.mode == 'sharded' and (options.replication_port is not None or
+                                  options.replica_of):
+    parser.error("replication is not supported in sharded mode")
+if options.shard_host is not None and options.mode != 'sharded':
+    parser.error("--shard-host only applies to sharded mode")
 
-back_uri = 'tcp://127.0.0.1:4225'
+front_uri = 'tcp://*:{}'.format(options.port)
+back_uri = 'tcp://127.0.0.1:{}'.format(options.port + 1)
+inproc_uri = 'inproc://escalator-workers'
 
-proxy = zmq.devices.ProcessDevice(
-    device_type=zmq.QUEUE, in_type=zmq.DEALER, out_type=zmq.ROUTER
-)
-proxy.bind_out('tcp://*:4224')
-proxy.bind_in(back_uri)
-proxy.start()
+databases_options = {
+    'cursor_timeout': options.cursor_timeout,
+    'max_cursors': options.max_cursors,
+    'cache_size': options.cache_size,
+    'bloom_error_rate': options.bloom_error_rate,
+    'max_open': options.max_open_dbs,
+    'group_commit_window': options.group_commit_window,
+    'group_commit_size': options.group_commit_size,
+    'durability': getattr(protocol.durability, options.durability.upper()),
+    'sync_interval': options.sync_interval,
+    'snapshot_timeout': options.snapshot_timeout,
+    'max_snapshots': options.max_snapshots,
+    'codec': options.codec,
+    'compression_level': options.compression_level,
+    'compression_threshold': options.compression_threshold,
+    'watch_values': options.watch_values,
+    'watch_buffer': options.watch_buffer,
+    'changelog_retention': options.changelog_retention,
+    'expiry_interval': options.expiry_interval,
+    'expiry_batch_size': options.expiry_batch_size,
+    'blob_sweep_interval': options.blob_sweep_interval,
+    'blob_sweep_grace': options.blob_sweep_grace
+}
+if options.watch_port is not None:
+    watch_uri = 'tcp://*:{}'.format(options.watch_port)
+    databases_options['watch_uri'] = watch_uri
+if options.replication_port is not None:
+    databases_options['replication_log_size'] = options.replication_log_size
+    databases_options['replication_log_bytes'] = \
+        options.replication_log_bytes
+if options.replica_of:
+    databases_options['read_only'] = True
 
-databases = Databases('dbs')
 
-nb_workers = 8
-workers = []
+def open_databases():
+    databases = Databases(options.dbs, **databases_options)
+    if options.replication_port is not None:
+        databases.replication = Replicator(
+            databases, 'tcp://*:{}'.format(options.replication_port))
+    elif options.replica_of:
+        databases.replication = Replica(
+            databases, 'tcp://{}'.format(options.replica_of))
+    if databases.replication is not None:
+        databases.replication.start()
+    return databases
 
-for i in range(nb_workers):
-    worker = Worker(databases, back_uri)
-    worker.daemon = True
-    worker.start()
-    workers.append(worker)
 
-try:
+def start_workers(databases, uri):
+    workers = []
+
+    for i in range(options.workers):
+        worker = Worker(databases, uri)
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+
+    return workers
+
+
+def serve_proxy():
+    proxy = zmq.devices.ProcessDevice(
+        device_type=zmq.QUEUE, in_type=zmq.DEALER, out_type=zmq.ROUTER
+    )
+    proxy.bind_out(front_uri)
+    proxy.bind_in(back_uri)
+    proxy.start()
+
+    start_workers(open_databases(), back_uri)
+
     proxy.join()
+
+
+def serve_inproc():
+    # the workers use the same global context, so inproc endpoints bound
+    # here are reachable from their threads
+    context = zmq.Context.instance()
+    frontend = context.socket(zmq.ROUTER)
+    frontend.bind(front_uri)
+    backend = context.socket(zmq.DEALER)
+    backend.bind(inproc_uri)
+
+    start_workers(open_databases(), inproc_uri)
+
+    zmq.proxy(frontend, backend)
+
+
+def serve_router():
+    Router(open_databases(), front_uri, options.workers).run()
+
+
+def serve_sharded():
+    if options.watch_port is not None:
+        # shards publish to the frontend which forwards to subscribers
+        shards_watch_uri = shard_watch_uri(options.port, options.shards)
+        start_watch_proxy(watch_uri, shards_watch_uri)
+        databases_options.update(watch_uri=shards_watch_uri,
+                                 watch_bind=False)
+    start_shards(options.dbs, options.shards, options.port, options.workers,
+                 options.shard_host, **databases_options)
+    Frontend(front_uri, [shard_uri(options.port, shard)
+                         for shard in range(options.shards)]).run()
+
+
+try:
+    if options.mode == 'router':
+        serve_router()
+    elif options.mode == 'inproc':
+        serve_inproc()
+    elif options.mode == 'sharded':
+        serve_sharded()
+    else:
+        serve_proxy()
 except KeyboardInterrupt:
     print("Stopping...")
     pass
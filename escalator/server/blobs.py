@@ -0,0 +1,49 @@
+import time
+
+from . import protocol
+from .protocol.blob import CHUNK_PREFIX, split_chunk_key, unpack_manifest
+
+
+def is_current(db, key, blob_id):
+    value = db.get(key)
+    if value is None:
+        return False
+    try:
+        manifest = unpack_manifest(protocol.codec.decode(value))
+    except Exception:
+        return False
+    return manifest[0] == blob_id
+
+
+class Blobs(object):
+
+    def __init__(self):
+        # when the blobs whose manifest was found missing were first seen
+        # so, uploads write their chunks before their manifest
+        self.orphans = {}
+        self.swept = 0
+
+    def due(self, db, grace):
+        # chunks of the blobs no manifest pointed to for grace seconds,
+        # left by plain puts and deletes over blobs, failed uploads and
+        # uploads racing on a key
+        now = time.time()
+        orphans = {}
+        iterator = db.iterator(prefix=CHUNK_PREFIX, include_value=False)
+        for chunk in iterator:
+            key, blob_id, _ = split_chunk_key(chunk)
+            blob = key, blob_id
+            if blob not in orphans:
+                orphans[blob] = None if is_current(db, key, blob_id) \
+                    else self.orphans.get(blob, now)
+            if orphans[blob] is not None and now - orphans[blob] >= grace:
+                yield chunk
+        iterator.close()
+        self.orphans = {blob: since for blob, since in orphans.items()
+                        if since is not None and now - since < grace}
+
+    def stats(self):
+        return {
+            'orphans': len(self.orphans),
+            'swept': self.swept
+        }
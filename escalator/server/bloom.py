@@ -0,0 +1,82 @@
+import hashlib
+import math
+import struct
+from threading import Lock
+
+
+class Filter(object):
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.nb_bits = max(8, int(-capacity * math.log(error_rate) /
+                                  math.log(2) ** 2))
+        self.nb_hashes = max(1, int(round(self.nb_bits / capacity *
+                                          math.log(2))))
+        self.bits = bytearray((self.nb_bits + 7) // 8)
+        self.count = 0
+
+    def positions(self, h1, h2):
+        return [(h1 + i * h2) % self.nb_bits for i in range(self.nb_hashes)]
+
+    def add(self, h1, h2):
+        for pos in self.positions(h1, h2):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, hashes):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self.positions(*hashes))
+
+
+class BloomFilter(object):
+    def __init__(self, error_rate=0.01, capacity=1024):
+        self.error_rate = error_rate
+        self.filters = [Filter(capacity, error_rate / 2)]
+        self.checks = 0
+        self.negatives = 0
+        self.false_positives = 0
+        self._lock = Lock()
+
+    @classmethod
+    def from_db(cls, db, error_rate=0.01):
+        count = sum(1 for _ in db.iterator(include_value=False))
+        bloom = cls(error_rate, max(1024, 2 * count))
+        for key in db.iterator(include_value=False):
+            bloom.add(key)
+        return bloom
+
+    @staticmethod
+    def hashes(key):
+        return struct.unpack('<QQ', hashlib.md5(key).digest())
+
+    def add(self, key):
+        hashes = self.hashes(key)
+        with self._lock:
+            # rewrites of a key would otherwise grow the filter as writes,
+            # not as keys
+            if any(hashes in f for f in self.filters):
+                return
+            current = self.filters[-1]
+            if current.count >= current.capacity:
+                error_rate = self.error_rate / 2 ** (len(self.filters) + 1)
+                current = Filter(2 * current.capacity, error_rate)
+                self.filters.append(current)
+            current.add(*hashes)
+
+    def __contains__(self, key):
+        hashes = self.hashes(key)
+        self.checks += 1
+        if any(hashes in f for f in self.filters):
+            return True
+        self.negatives += 1
+        return False
+
+    def stats(self):
+        return {
+            'checks': self.checks,
+            'negatives': self.negatives,
+            'false_positives': self.false_positives,
+            'keys': sum(f.count for f in self.filters),
+            'filters': len(self.filters),
+            'size': sum(len(f.bits) for f in self.filters)
+        }
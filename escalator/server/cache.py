@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class Cache(object):
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._values = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                self.misses += 1
+                return None, self.generation
+            self._values.move_to_end(key)
+            self.hits += 1
+            return value, self.generation
+
+    def set(self, key, value, generation):
+        size = len(key) + len(value)
+        if size > self.max_size:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._discard(key)
+            self._values[key] = value
+            self.size += size
+            while self.size > self.max_size:
+                self._discard(next(iter(self._values)))
+
+    def invalidate(self, keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._values.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._values),
+            'size': self.size,
+            'max_size': self.max_size
+        }
+
+    def _discard(self, key):
+        value = self._values.pop(key, None)
+        if value is not None:
+            self.size -= len(key) + len(value)
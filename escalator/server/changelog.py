@@ -0,0 +1,158 @@
+import os
+import struct
+import time
+from collections import deque
+from itertools import islice
+from threading import Lock
+
+from . import protocol
+from .keyspace import prefix_end, reserved
+
+LOG_PREFIX = reserved(b'changes')
+EPOCH_KEY = reserved(b'epoch')
+SEQUENCE = struct.Struct('!Q')
+# size from which the entries read at once are cut
+PAGE_SIZE = 1024 * 1024
+
+
+def entry_key(sequence):
+    return LOG_PREFIX + SEQUENCE.pack(sequence)
+
+
+def entry_size(entry):
+    return sum(len(key) + len(value or b'') for key, value in entry[2])
+
+
+def take(entries, limit, max_bytes=None):
+    # at least one entry, however large
+    taken = []
+    size = 0
+    for entry in islice(entries, limit):
+        size += entry_size(entry)
+        if taken and max_bytes is not None and size > max_bytes:
+            break
+        taken.append(entry)
+    return taken
+
+
+def is_log_key(key):
+    return key == EPOCH_KEY or key.startswith(LOG_PREFIX)
+
+
+def delete_range(db, start, stop, batch_size=1000):
+    keys = db.iterator(start=start, stop=stop, include_value=False)
+    while True:
+        batch = list(islice(keys, batch_size))
+        if not batch:
+            break
+        with db.write_batch() as wb:
+            for key in batch:
+                wb.delete(key)
+
+
+class Changelog(object):
+
+    def __init__(self, size=0, retention=0, max_bytes=None):
+        # the last size entries, up to max_bytes, are kept in memory and
+        # the last retention ones on disk, in the batch of the writes they
+        # describe. Without retention sequences restart with the process,
+        # the epoch tells consumers whether their position is still
+        # meaningful.
+        self.epoch = os.urandom(8)
+        self.sequence = 0
+        self.retention = retention
+        self.size = size
+        self.max_bytes = max_bytes
+        self.entries = deque()
+        self.entries_bytes = 0
+        self.lock = Lock()
+        self.db = None
+
+    @staticmethod
+    def discard(db):
+        # a log which stopped following the writes can not be continued
+        if db.get(EPOCH_KEY) is not None:
+            db.delete(EPOCH_KEY)
+            delete_range(db, LOG_PREFIX, prefix_end(LOG_PREFIX))
+
+    def open(self, db):
+        with self.lock:
+            self.db = db
+            if not self.retention:
+                self.discard(db)
+                return
+            epoch = db.get(EPOCH_KEY)
+            if epoch is None:
+                db.put(EPOCH_KEY, self.epoch)
+            else:
+                self.epoch = epoch
+            last = next(db.iterator(prefix=LOG_PREFIX, reverse=True,
+                                    include_value=False), None)
+            if last is not None:
+                self.sequence = max(self.sequence, SEQUENCE.unpack(
+                    last[len(LOG_PREFIX):])[0])
+            delete_range(db, LOG_PREFIX,
+                         entry_key(max(0, self.first())))
+
+    def first(self):
+        if self.retention:
+            return max(1, self.sequence - self.retention + 1)
+        return self.sequence - len(self.entries) + 1
+
+    def next_entry(self, ops):
+        return (self.sequence + 1, time.time(),
+                [(key, value if value is None else bytes(value))
+                 for key, value in ops])
+
+    def records(self, entry):
+        if not self.retention:
+            return ()
+        sequence, timestamp, ops = entry
+        records = [(entry_key(sequence),
+                    protocol.msg.pack_msg(timestamp, ops))]
+        if sequence > self.retention:
+            records.append((entry_key(sequence - self.retention), None))
+        return records
+
+    def append(self, entry):
+        self.sequence = entry[0]
+        if not self.size:
+            return
+        self.entries.append(entry)
+        self.entries_bytes += entry_size(entry)
+        while len(self.entries) > self.size or \
+                self.max_bytes is not None and \
+                self.entries_bytes > self.max_bytes:
+            self.entries_bytes -= entry_size(self.entries.popleft())
+
+    def since(self, sequence, limit, max_bytes=PAGE_SIZE):
+        # None when the entries following sequence are not available
+        with self.lock:
+            current = self.sequence
+            first = current - len(self.entries) + 1
+            if first - 1 <= sequence <= current:
+                return take(islice(self.entries, sequence - first + 1, None),
+                            limit, max_bytes)
+        if not self.retention or not \
+           current - self.retention <= sequence <= current:
+            return None
+        iterator = self.db.iterator(start=entry_key(sequence + 1),
+                                    stop=prefix_end(LOG_PREFIX))
+        entries = take(((SEQUENCE.unpack(key[len(LOG_PREFIX):])[0],)
+                        + tuple(protocol.msg.unpack_msg(value))
+                        for key, value in iterator), limit, max_bytes)
+        iterator.close()
+        if entries and entries[0][0] != sequence + 1:
+            # trimmed meanwhile
+            return None
+        return entries
+
+    def stats(self):
+        return {
+            'epoch': self.epoch.hex(),
+            'sequence': self.sequence,
+            'first': self.first(),
+            'retention': self.retention,
+            'memory_entries': len(self.entries),
+            'memory_bytes': self.entries_bytes
+        }
@@ -0,0 +1,41 @@
+import zlib
+
+from . import protocol
+
+
+class Compressor(object):
+    def __init__(self, codec='snappy', level=6, threshold=1024):
+        self.configure(codec, level, threshold)
+        self.compressed = 0
+        self.skipped = 0
+        self.raw_size = 0
+        self.stored_size = 0
+
+    def configure(self, codec, level, threshold):
+        self.codec = codec
+        self.level = level
+        self.threshold = threshold
+
+    def encode(self, value):
+        if self.codec == 'zlib' and len(value) >= self.threshold:
+            data = zlib.compress(value, self.level)
+            if len(data) + 2 < len(value):
+                self.compressed += 1
+                self.raw_size += len(value)
+                self.stored_size += len(data) + 2
+                return protocol.codec.tag(protocol.codec.ZLIB, data)
+            self.skipped += 1
+        if value[:1] == protocol.codec.TAG:
+            return protocol.codec.tag(protocol.codec.RAW, value)
+        return value
+
+    def stats(self):
+        return {
+            'codec': self.codec,
+            'compressed': self.compressed,
+            'skipped': self.skipped,
+            'raw_size': self.raw_size,
+            'stored_size': self.stored_size,
+            'ratio': (self.stored_size / self.raw_size
+                      if self.raw_size else 1.)
+        }
@@ -0,0 +1,368 @@
+import json
+import os.path
+import time
+from itertools import chain, islice
+from threading import Lock
+
+import plyvel
+
+from . import keyspace
+from . import protocol
+from .blobs import Blobs
+from .bloom import BloomFilter
+from .changelog import Changelog, is_log_key
+from .compression import Compressor
+from .expiry import EXPIRES_PREFIX, Expiry
+from .group_commit import GroupCommit
+
+# stripes of the locks taken by read-modify-write commands
+KEY_LOCKS = 64
+
+
+class WriteBatch(object):
+    def __init__(self, database, transaction, durability=None):
+        self.database = database
+        self.transaction = transaction
+        self.durability = durability
+        self.ops = []
+        self.ttls = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if not self.transaction or not type:
+            self.write()
+
+    def put(self, key, value, ttl=None):
+        self.database.add(key)
+        if ttl is not None:
+            self.ttls[len(self.ops)] = ttl
+        self.ops.append((key, value))
+
+    def delete(self, key):
+        self.ops.append((key, None))
+
+    def write(self):
+        ops, self.ops = self.ops, []
+        ttls, self.ttls = self.ttls, {}
+        if ops:
+            self.database.write(ops, self.durability, ttls)
+
+
+class Database(object):
+    options_file = 'escalator.json'
+
+    def __init__(self, pool, path, cache=None, bloom_error_rate=0,
+                 group_commit_window=0, group_commit_size=256,
+                 durability=protocol.durability.NONE, codec='snappy',
+                 compression_level=6, compression_threshold=1024,
+                 changelog_size=0, changelog_retention=0,
+                 changelog_bytes=None):
+        self.pool = pool
+        self.path = path
+        self.name = os.path.basename(path).encode()
+        self.db = None
+        self.options = {
+            'durability': durability,
+            'codec': codec,
+            'compression_level': compression_level,
+            'compression_threshold': compression_threshold
+        }
+        self.compressor = Compressor(codec, compression_level,
+                                     compression_threshold)
+        self.dirty = False
+        self.cache = cache
+        self.group_commit = None
+        if group_commit_window:
+            self.group_commit = GroupCommit(self.apply, group_commit_window,
+                                            group_commit_size)
+        self.changelog = None
+        if changelog_size or changelog_retention:
+            self.changelog = Changelog(changelog_size, changelog_retention,
+                                       changelog_bytes)
+        self.sync_commit = None
+        if self.changelog is not None and self.group_commit is None:
+            # the log takes the writes one at a time, synced ones are
+            # grouped so that they share their fsync
+            self.sync_commit = GroupCommit(self.apply, 0, group_commit_size)
+        self.expiry = Expiry()
+        self.blobs = Blobs()
+        self._key_locks = [Lock() for _ in range(KEY_LOCKS)]
+        self.bloom = None
+        self.bloom_error_rate = bloom_error_rate
+        self.users = 0
+        self.last_used = 0
+        self._lock = Lock()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.release()
+
+    def acquire(self):
+        with self._lock:
+            self.users += 1
+            self.last_used = time.time()
+            if self.db is not None:
+                return
+        try:
+            self.pool.reopen(self)
+        except:
+            self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.users -= 1
+
+    def open(self, create=False):
+        try:
+            with open(os.path.join(self.path, self.options_file)) as f:
+                self.options.update(json.load(f))
+        except IOError:
+            pass
+        compression = 'snappy' if self.options['codec'] == 'snappy' else None
+        self.db = plyvel.DB(self.path, create_if_missing=create,
+                            compression=compression)
+        self.compressor.configure(self.options['codec'],
+                                  self.options['compression_level'],
+                                  self.options['compression_threshold'])
+        if self.changelog is not None:
+            self.changelog.open(self.db)
+        else:
+            Changelog.discard(self.db)
+        self.expiry.open(self.db)
+        if self.bloom is None and self.bloom_error_rate:
+            self.bloom = BloomFilter.from_db(self, self.bloom_error_rate)
+
+    def configure(self, options):
+        # only the options given are stored, the others keep following the
+        # settings of the server
+        path = os.path.join(self.path, self.options_file)
+        try:
+            with open(path) as f:
+                stored = json.load(f)
+        except IOError:
+            stored = {}
+        stored.update(options)
+        with open(path, 'w') as f:
+            json.dump(stored, f)
+        self.options.update(options)
+        self.compressor.configure(self.options['codec'],
+                                  self.options['compression_level'],
+                                  self.options['compression_threshold'])
+
+    def close(self):
+        with self._lock:
+            if self.users or self.db is None:
+                return False
+            if self.dirty:
+                self.sync()
+            self.db.close()
+            self.db = None
+        if self.cache is not None:
+            self.cache.clear()
+        return True
+
+    def get(self, key):
+        if self.bloom is not None and key not in self.bloom:
+            return None
+        if self.cache is None:
+            value = self.db.get(key)
+        else:
+            value, generation = self.cache.get(key)
+            if value is None:
+                value = self.db.get(key)
+                if value is not None:
+                    self.cache.set(key, value, generation)
+        if value is None:
+            if self.bloom is not None:
+                self.bloom.false_positives += 1
+        elif self.expiry.active and self.expiry.is_expired(self.db, key):
+            # not reaped yet
+            return None
+        return value
+
+    def ttl(self, key):
+        if not self.expiry.active:
+            return None
+        return self.expiry.remaining(self.db, key)
+
+    def key_lock(self, key):
+        # only serializes the commands which take it, not plain writes
+        return self._key_locks[hash(key) % KEY_LOCKS]
+
+    def put(self, key, value, durability=None, ttl=None):
+        self.add(key)
+        self.write(((key, value),), durability,
+                   None if ttl is None else {0: ttl})
+
+    def delete(self, key, durability=None):
+        self.write(((key, None),), durability)
+
+    def write(self, ops, durability=None, ttls=None):
+        if durability is None:
+            durability = self.options['durability']
+        sync = durability == protocol.durability.SYNC
+        ops = [(key, value if value is None
+                else self.compressor.encode(value)) for key, value in ops]
+        if ttls and not self.expiry.active:
+            self.expiry.active = True
+            self.pool.schedule_expiry()
+        records = []
+        if self.expiry.active:
+            # deadlines are written with the ops, and logged with them for
+            # replicas
+            records = self.expiry.records(ops, ttls or {})
+        if self.group_commit is not None:
+            self.group_commit.write(ops + records, sync)
+        elif sync and self.sync_commit is not None:
+            self.sync_commit.write(ops + records, sync)
+        else:
+            self.apply(ops + records, sync)
+        self.publish(ops)
+        if durability == protocol.durability.PERIODIC:
+            self.dirty = True
+            self.pool.schedule_sync()
+
+    def publish(self, ops):
+        # watchers only see the keys of the user
+        if self.pool.publisher is not None:
+            ops = [op for op in ops if not keyspace.is_reserved(op[0])]
+            if ops:
+                self.pool.publisher.publish(self.name, ops)
+
+    def apply(self, ops, sync=False):
+        if not self.expiry.active:
+            return self._log(ops, sync)
+        # the reaper checks deadlines and deletes under the same lock
+        with self.expiry.lock:
+            self._log(ops, sync)
+
+    def _log(self, ops, sync=False):
+        if self.changelog is None:
+            return self._apply(ops, sync)
+        # the log follows the order of the writes, its entries are stored
+        # in the batch of the ops they describe
+        with self.changelog.lock:
+            entry = self.changelog.next_entry(ops)
+            self._apply(ops, sync, self.changelog.records(entry))
+            self.changelog.append(entry)
+        if self.pool.replication is not None:
+            self.pool.replication.notify(self.name)
+
+    def _apply(self, ops, sync=False, records=()):
+        if len(ops) == 1 and not records:
+            key, value = ops[0]
+            if value is None:
+                self.db.delete(key, sync=sync)
+            else:
+                self.db.put(key, value, sync=sync)
+        else:
+            with self.db.write_batch(sync=sync) as wb:
+                for key, value in chain(ops, records):
+                    if value is None:
+                        wb.delete(key)
+                    else:
+                        wb.put(key, value)
+        self.invalidate([key for key, _ in ops])
+
+    def replay(self, ops):
+        for key, value in ops:
+            if value is not None:
+                self.add(key)
+                if key.startswith(EXPIRES_PREFIX):
+                    self.expiry.active = True
+        self.apply(ops)
+        self.publish(ops)
+
+    def clear(self, batch_size=1000):
+        keys = (key for key in self.db.iterator(include_value=False)
+                if not is_log_key(key))
+        while True:
+            ops = [(key, None) for key in islice(keys, batch_size)]
+            if not ops:
+                break
+            self.apply(ops)
+
+    def reap(self, batch_size=1000):
+        with self.expiry.lock:
+            ops, keys = self.expiry.due(self.db, batch_size)
+            if ops:
+                self._log(ops)
+        self.publish([(key, None) for key in keys])
+        return len(ops)
+
+    def sweep(self, grace, batch_size=1000):
+        chunks = self.blobs.due(self.db, grace)
+        swept = 0
+        while True:
+            ops = [(chunk, None) for chunk in islice(chunks, batch_size)]
+            if not ops:
+                break
+            self.apply(ops)
+            swept += len(ops)
+        self.blobs.swept += swept
+        return swept
+
+    def write_batch(self, transaction=False, durability=None):
+        return WriteBatch(self, transaction, durability)
+
+    def sync(self):
+        self.dirty = False
+        self.db.write_batch(sync=True).write()
+
+    def iterator(self, **kwargs):
+        return self.db.iterator(**kwargs)
+
+    def snapshot(self):
+        return self.db.snapshot()
+
+    def sequenced_snapshot(self):
+        if self.changelog is None:
+            return self.db.snapshot(), None
+        # taken between two writes, it matches a position of the log
+        with self.changelog.lock:
+            return self.db.snapshot(), (self.changelog.epoch,
+                                        self.changelog.sequence)
+
+    def stats(self):
+        stats = {
+            'open': self.db is not None,
+            'users': self.users,
+            'durability': self.options['durability'],
+            'compression': self.compressor.stats(),
+            'commands': {}
+        }
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        if self.bloom is not None:
+            stats['bloom'] = self.bloom.stats()
+        if self.changelog is not None:
+            stats['changelog'] = self.changelog.stats()
+        if self.expiry.active:
+            stats['expiry'] = self.expiry.stats()
+        if self.blobs.orphans or self.blobs.swept:
+            stats['blobs'] = self.blobs.stats()
+        if self.group_commit is not None:
+            stats['group_commit'] = {
+                'groups': self.group_commit.groups,
+                'writes': self.group_commit.writes
+            }
+        if self.sync_commit is not None:
+            stats['sync_commit'] = {
+                'groups': self.sync_commit.groups,
+                'writes': self.sync_commit.writes
+            }
+        return stats
+
+    def add(self, key):
+        if self.bloom is not None:
+            self.bloom.add(key)
+
+    def invalidate(self, keys):
+        if self.cache is not None:
+            self.cache.invalidate(keys)
@@ -1,8 +1,17 @@
 import os.path
-from threading import Lock
+import time
+from operator import attrgetter
+from threading import Lock, Thread
 
 import plyvel
 
+from . import protocol
+from .cache import Cache
+from .database import Database
+from .sessions import Sessions
+from .stats import Stats
+from .watch import Publisher
+
 
 class Databases(object):
     class OpenError(Exception):
@@ -11,40 +20,195 @@ class Databases(object):
     class NotExistError(Exception):
         pass
 
-    def __init__(self, working_dir='dbs'):
-        self._databases = {}
-        self._names = []
+    def __init__(self, working_dir='dbs', shard=0, nb_shards=1,
+                 cursor_timeout=60, max_cursors=64, cache_size=0,
+                 bloom_error_rate=0, max_open=0,
+                 group_commit_window=0, group_commit_size=256,
+                 durability=protocol.durability.NONE, sync_interval=1,
+                 snapshot_timeout=300, max_snapshots=64, codec='snappy',
+                 compression_level=6, compression_threshold=1024,
+                 watch_uri=None, watch_bind=True, watch_values=False,
+                 watch_buffer=1000, replication_log_size=0,
+                 replication_log_bytes=None,
+                 changelog_retention=0, expiry_interval=1,
+                 expiry_batch_size=1000, blob_sweep_interval=300,
+                 blob_sweep_grace=3600, read_only=False, endpoint=None):
+        self._databases = []
+        self._indexes = {}
+        self._open = set()
         self._working_dir = working_dir
+        self._shard = shard
+        self._nb_shards = nb_shards
+        self._cache_size = cache_size
+        self._bloom_error_rate = bloom_error_rate
+        self._max_open = max_open
+        self.group_commit_window = group_commit_window
+        self._group_commit_size = group_commit_size
+        self.durability = durability
+        self._sync_interval = sync_interval
+        self._compression = (codec, compression_level, compression_threshold)
+        self._replication_log_size = replication_log_size
+        self._replication_log_bytes = replication_log_bytes
+        self._changelog_retention = changelog_retention
+        self._expiry_interval = expiry_interval
+        self._expiry_batch_size = expiry_batch_size
+        self._blob_sweep_interval = blob_sweep_interval
+        self._blob_sweep_grace = blob_sweep_grace
+        self.read_only = read_only
+        # where clients reach this shard without going through the frontend
+        self.endpoint = endpoint
+        self._syncer = None
+        self._reaper = None
         self._lock = Lock()
+        self.cursors = Sessions(cursor_timeout, max_cursors)
+        self.snapshots = Sessions(snapshot_timeout, max_snapshots)
+        self.stats = Stats()
+        self.replication = None
+        self.publisher = None
+        if watch_uri is not None:
+            self.publisher = Publisher(watch_uri, watch_bind, watch_values,
+                                       watch_buffer)
+            self.publisher.start()
+        # replicas delete blob chunks when their primary does
+        if blob_sweep_interval and not read_only:
+            sweeper = Thread(target=self._sweep_forever)
+            sweeper.daemon = True
+            sweeper.start()
+
+    def __iter__(self):
+        return iter(list(self._databases))
 
     def __contains__(self, uid):
-        return 0 <= uid < len(self._names)
+        index, shard = divmod(uid, self._nb_shards)
+        return shard == self._shard and 0 <= index < len(self._databases)
 
     def get_db(self, name):
-        return self._databases[name]
+        return self._databases[self._indexes[name]]
+
+    def find(self, name):
+        # by the name of the database, the basename of its path
+        return self.get_db(os.path.join(self._working_dir, name.decode()))
 
     def get_name(self, uid):
+        return self.get(uid).path
+
+    def get(self, uid):
         uid = int(uid)
         if uid not in self:
             raise IndexError('Database with uid {} does not exist'.format(uid))
-        return self._names[uid]
+        return self._databases[uid // self._nb_shards]
 
-    def get(self, uid):
-        return self.get_db(self.get_name(uid))
+    def connect(self, name, create=False, options=None):
+        name = os.path.join(self._working_dir, name)
+        index = self._indexes.get(name)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(name)
+                if index is None:
+                    index = self._register(name, create, options)
+        if create and options:
+            with self._databases[index] as database:
+                database.configure(options)
+        return index * self._nb_shards + self._shard
 
-    def connect(self, name, create=False):
+    def connect_all(self):
+        for name in sorted(os.listdir(self._working_dir)):
+            if os.path.isfile(os.path.join(self._working_dir, name,
+                                           'CURRENT')):
+                self.connect(name)
+
+    def reopen(self, database):
         with self._lock:
-            try:
-                name = os.path.join(self._working_dir, name)
-                if name not in self._databases:
-                    self._databases[name] = plyvel.DB(name,
-                                                      create_if_missing=create)
-                    self._names.append(name)
-                return self._names.index(name)
-            except plyvel._plyvel.IOError as e:
-                raise Databases.OpenError(*e.args)
-            except plyvel._plyvel.Error as e:
-                raise Databases.NotExistError(*e.args)
+            if database.db is None:
+                self._open_db(database)
+
+    def schedule_sync(self):
+        if self._syncer is None:
+            with self._lock:
+                if self._syncer is None:
+                    self._syncer = Thread(target=self._sync_forever)
+                    self._syncer.daemon = True
+                    self._syncer.start()
+
+    def schedule_expiry(self):
+        if self._reaper is None:
+            with self._lock:
+                self._start_reaper()
 
     def list_dbs(self):
-        return list(self._names)
+        return [database.path for database in self._databases]
+
+    def _register(self, name, create, options=None):
+        cache = Cache(self._cache_size) if self._cache_size else None
+        database = Database(self, name, cache, self._bloom_error_rate,
+                            self.group_commit_window,
+                            self._group_commit_size, self.durability,
+                            *self._compression,
+                            changelog_size=self._replication_log_size,
+                            changelog_bytes=self._replication_log_bytes,
+                            changelog_retention=self._changelog_retention)
+        if create and options:
+            # settings such as LevelDB's compression apply when opening
+            database.options.update(options)
+        try:
+            self._open_db(database, create)
+        except plyvel._plyvel.IOError as e:
+            raise Databases.OpenError(*e.args)
+        except plyvel._plyvel.Error as e:
+            raise Databases.NotExistError(*e.args)
+        self._databases.append(database)
+        self._indexes[name] = len(self._databases) - 1
+        return self._indexes[name]
+
+    def _open_db(self, database, create=False):
+        if self._max_open:
+            for idle in sorted(self._open, key=attrgetter('last_used')):
+                if len(self._open) < self._max_open:
+                    break
+                if idle.close():
+                    self._open.discard(idle)
+        database.open(create)
+        self._open.add(database)
+        if database.expiry.active:
+            self._start_reaper()
+
+    def _start_reaper(self):
+        # replicas delete expired keys when their primary does
+        if self._reaper is None and not self.read_only:
+            self._reaper = Thread(target=self._reap_forever)
+            self._reaper.daemon = True
+            self._reaper.start()
+
+    def _sync_forever(self):
+        while True:
+            time.sleep(self._sync_interval)
+            for database in list(self._databases):
+                if database.dirty and database.db is not None:
+                    with database:
+                        database.sync()
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(self._expiry_interval)
+            for database in list(self._databases):
+                if not database.expiry.active or database.db is None:
+                    continue
+                try:
+                    with database:
+                        while database.reap(self._expiry_batch_size):
+                            pass
+                except Exception as e:
+                    print('expiry error:', e)
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self._blob_sweep_interval)
+            for database in list(self._databases):
+                if database.db is None:
+                    continue
+                try:
+                    with database:
+                        database.sweep(self._blob_sweep_grace,
+                                       self._expiry_batch_size)
+                except Exception as e:
+                    print('blob sweep error:', e)
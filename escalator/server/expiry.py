@@ -0,0 +1,85 @@
+import struct
+import time
+from itertools import islice
+from threading import Lock
+
+from .keyspace import reserved
+
+# deadline of each key with a TTL, and the same deadlines indexed by time
+EXPIRES_PREFIX = reserved(b'expires')
+DEADLINES_PREFIX = reserved(b'deadlines')
+DEADLINE = struct.Struct('!Q')
+
+
+def deadline(ttl, now=None):
+    if now is None:
+        now = time.time()
+    return DEADLINE.pack(int((now + ttl) * 1000))
+
+
+class Expiry(object):
+
+    def __init__(self):
+        # checked by reads and writes once a key of the database was given
+        # a TTL
+        self.active = False
+        self.expired = 0
+        self.lock = Lock()
+
+    def open(self, db):
+        self.active = next(db.iterator(prefix=EXPIRES_PREFIX,
+                                       include_value=False), None) is not None
+
+    def records(self, ops, ttls):
+        now = time.time()
+        records = []
+        for i, (key, value) in enumerate(ops):
+            ttl = ttls.get(i)
+            if ttl is None:
+                # index entries left behind are dropped by the reaper
+                records.append((EXPIRES_PREFIX + key, None))
+            else:
+                key_deadline = deadline(ttl, now)
+                records.append((EXPIRES_PREFIX + key, key_deadline))
+                records.append((DEADLINES_PREFIX + key_deadline + key, b''))
+        return records
+
+    def is_expired(self, source, key):
+        key_deadline = source.get(EXPIRES_PREFIX + key)
+        return key_deadline is not None and \
+            key_deadline <= deadline(0)
+
+    def remaining(self, source, key):
+        key_deadline = source.get(EXPIRES_PREFIX + key)
+        if key_deadline is None:
+            return None
+        ttl = DEADLINE.unpack(key_deadline)[0] / 1000 - time.time()
+        return ttl if ttl > 0 else None
+
+    def due(self, db, limit):
+        # deletes of the keys whose deadline passed and of their index
+        # entries, the caller holds self.lock
+        ops = []
+        keys = []
+        start = len(DEADLINES_PREFIX)
+        iterator = db.iterator(start=DEADLINES_PREFIX,
+                               stop=DEADLINES_PREFIX + deadline(0),
+                               include_stop=True, include_value=False)
+        for index_key in islice(iterator, limit):
+            key_deadline = index_key[start:start + DEADLINE.size]
+            key = index_key[start + DEADLINE.size:]
+            ops.append((index_key, None))
+            if db.get(EXPIRES_PREFIX + key) == key_deadline:
+                ops.append((EXPIRES_PREFIX + key, None))
+                ops.append((key, None))
+                keys.append(key)
+        iterator.close()
+        self.expired += len(keys)
+        return ops, keys
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'expired': self.expired
+        }
+
@@ -0,0 +1,68 @@
+import time
+from threading import Condition, Event, Lock
+
+
+class Write(object):
+    def __init__(self, ops, sync):
+        self.ops = ops
+        self.sync = sync
+        self.done = Event()
+        self.error = None
+
+
+class GroupCommit(object):
+    def __init__(self, commit, window=0.002, max_size=256):
+        self.commit = commit
+        self.window = window
+        self.max_size = max_size
+        self.groups = 0
+        self.writes = 0
+        self._pending = []
+        self._size = 0
+        self._leader = False
+        self._condition = Condition()
+        # one group commits at a time, the writes coming meanwhile make the
+        # next one
+        self._commit_lock = Lock()
+
+    def write(self, ops, sync=False):
+        write = Write(ops, sync)
+        with self._condition:
+            self._pending.append(write)
+            self._size += len(ops)
+            leader = not self._leader
+            if leader:
+                self._leader = True
+            elif self._size >= self.max_size:
+                self._condition.notify()
+        if leader:
+            self._lead()
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+
+    def _lead(self):
+        with self._commit_lock:
+            self._commit()
+
+    def _commit(self):
+        deadline = time.time() + self.window
+        with self._condition:
+            while self._size < self.max_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            writes, self._pending = self._pending, []
+            self._size = 0
+            self._leader = False
+        try:
+            self.commit([op for write in writes for op in write.ops],
+                        any(write.sync for write in writes))
+        except Exception as e:
+            for write in writes:
+                write.error = e
+        self.groups += 1
+        self.writes += len(writes)
+        for write in writes:
+            write.done.set()
@@ -0,0 +1,76 @@
+from itertools import chain
+
+from .protocol.keyspace import (RESERVED, RESERVED_END, is_reserved,
+                                prefix_end, reserved)
+
+MISSING = object()
+
+
+class Chain(chain):
+    def __new__(cls, iterators):
+        self = super(Chain, cls).__new__(cls, *iterators)
+        self.iterators = iterators
+        return self
+
+    def close(self):
+        for iterator in self.iterators:
+            if not isinstance(iterator, list):
+                iterator.close()
+
+
+def segment(source, start, stop, include_start, include_stop, reverse,
+            include_key=True, include_value=True, **kwargs):
+    iterator = source.iterator(start=start, stop=stop,
+                               include_start=include_start,
+                               include_stop=include_stop, reverse=reverse,
+                               include_key=include_key,
+                               include_value=include_value, **kwargs)
+    if not reverse or start is None or not include_start:
+        return iterator
+    # reverse plyvel iterators miss their start key when it is the only
+    # key of their range
+    first = next(iterator, MISSING)
+    if first is MISSING:
+        if stop is not None and (start > stop or
+                                 start == stop and not include_stop):
+            return iterator
+        value = source.get(start)
+        if value is None:
+            return iterator
+        if include_key and include_value:
+            first = (start, value)
+        elif include_key or include_value:
+            first = start if include_key else value
+        else:
+            # plyvel yields one None per item without key nor value
+            first = None
+    return Chain([[first], iterator])
+
+
+def iterator(source, prefix=None, start=None, stop=None,
+             include_start=True, include_stop=False, reverse=False,
+             **kwargs):
+    if prefix is not None:
+        start, stop = prefix, prefix_end(prefix)
+        include_start, include_stop = True, False
+    # the range is split around the reserved keys
+    segments = []
+    if start is None or start < RESERVED:
+        if stop is None or stop >= RESERVED:
+            segments.append((start, RESERVED, include_start, False))
+        else:
+            segments.append((start, stop, include_start, include_stop))
+    if stop is None or stop > RESERVED_END or \
+       (stop == RESERVED_END and include_stop):
+        if start is None or start < RESERVED_END:
+            segments.append((RESERVED_END, stop, True, include_stop))
+        else:
+            segments.append((start, stop, include_start, include_stop))
+    if reverse:
+        segments.reverse()
+    iterators = [segment(source, start, stop, include_start, include_stop,
+                         reverse, **kwargs)
+                 for start, stop, include_start, include_stop in segments]
+    if len(iterators) == 1:
+        return iterators[0]
+    return Chain(iterators)
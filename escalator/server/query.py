@@ -0,0 +1,67 @@
+import operator
+
+from . import protocol
+
+
+def contains(value, operand):
+    return value in operand
+
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': contains
+}
+
+
+class Query(object):
+
+    def __init__(self, where=None, fields=None):
+        # where is a list of (field, operator, operand) conditions on the
+        # fields of msgpack maps, all of them must hold
+        self.conditions = []
+        for field, op, operand in where or ():
+            if isinstance(op, bytes):
+                op = op.decode()
+            if op not in OPERATORS or \
+               op == 'in' and not isinstance(operand, (list, tuple)):
+                raise TypeError(op)
+            self.conditions.append((field, OPERATORS[op], operand))
+        self.fields = fields
+
+    def match(self, value):
+        for field, op, operand in self.conditions:
+            # maps missing the field do not match
+            if field not in value:
+                return False
+            try:
+                if not op(value[field], operand):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    def filter(self, items, include_value=True):
+        for key, stored in items:
+            try:
+                value = protocol.msg.unpack_msg(
+                    protocol.codec.decode(stored))
+            except Exception:
+                value = None
+            if isinstance(value, dict):
+                if not self.match(value):
+                    continue
+            elif self.conditions:
+                continue
+            if not include_value:
+                yield key
+            elif self.fields is None or not isinstance(value, dict):
+                yield key, stored
+            else:
+                yield key, protocol.msg.pack_arg(
+                    {field: value[field] for field in self.fields
+                     if field in value})
@@ -0,0 +1,373 @@
+import json
+import time
+from itertools import count
+from threading import Thread, local
+
+import zmq
+
+from . import protocol
+from .changelog import is_log_key
+
+# messages exchanged by a primary and its replicas, each one is the message
+# type followed by a msgpacked list of arguments starting with the name of
+# the database and a request id echoed by the reply
+LIST = b'l'
+CHANGES = b'c'
+SNAPSHOT = b's'
+SNAPSHOT_NEXT = b'n'
+# the primary can not continue from the replica's position
+BEHIND = b'b'
+
+PAGE_SIZE = 1024 * 1024
+
+
+def pack(msg_type, *args):
+    return [msg_type, protocol.msg.pack_msg(*args)]
+
+
+class Replicator(Thread):
+
+    def __init__(self, databases, uri, wait=1, snapshot_timeout=60,
+                 *args, **kwargs):
+        super(Replicator, self).__init__(*args, **kwargs)
+        self.daemon = True
+
+        self.context = zmq.Context.instance()
+        self.uri = uri
+        self.databases = databases
+        self.wait = wait
+        self.snapshot_timeout = snapshot_timeout
+        self.socket = None
+        # writers signal the databases replicas wait for
+        self.notify_uri = 'inproc://escalator-replication-{}'.format(
+            id(self))
+        self.notifications = self.context.socket(zmq.PULL)
+        self.notifications.bind(self.notify_uri)
+        self._local = local()
+        self.waiting = []
+        self.parked = set()
+        self.snapshots = {}
+        self.replicas = {}
+        self._ids = count(1)
+
+        self.handlers = {
+            LIST: self.list,
+            CHANGES: self.changes,
+            SNAPSHOT: self.snapshot,
+            SNAPSHOT_NEXT: self.snapshot_next
+        }
+
+    def run(self):
+        # databases existing on disk are replicated before being used
+        self.databases.connect_all()
+        self.socket = self.context.socket(zmq.ROUTER)
+        self.socket.bind(self.uri)
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        poller.register(self.notifications, zmq.POLLIN)
+
+        while True:
+            # replicas which are up to date wait up to self.wait seconds
+            # for new changes, they are answered when their database is
+            # written to
+            timeout = self.wait
+            if self.waiting:
+                timeout = max(0, min(request[-1] for request in self.waiting)
+                              - time.time())
+            changed = set()
+            for socket, _ in poller.poll(timeout * 1000):
+                if socket is self.notifications:
+                    while self.notifications.poll(0):
+                        changed.add(self.notifications.recv())
+                    continue
+                identity, msg_type, payload = self.socket.recv_multipart()
+                try:
+                    self.handlers[msg_type](identity,
+                                            *protocol.msg.unpack_msg(payload))
+                except Exception as e:
+                    print("replication error:", e)
+            now = time.time()
+            waiting, self.waiting = self.waiting, []
+            for request in waiting:
+                if request[1] in changed or request[-1] <= now:
+                    self.changes(*request)
+                else:
+                    self.waiting.append(request)
+            self.parked = {request[1] for request in self.waiting}
+            self.reap()
+
+    def notify(self, name):
+        # called by writers after logging a change
+        if name not in self.parked:
+            return
+        try:
+            socket = self._local.socket
+        except AttributeError:
+            socket = self._local.socket = self.context.socket(zmq.PUSH)
+            socket.connect(self.notify_uri)
+        try:
+            socket.send(name, zmq.NOBLOCK)
+        except zmq.Again:
+            pass
+
+    def reply(self, identity, msg_type, *args):
+        self.socket.send_multipart([identity] + pack(msg_type, *args))
+
+    def find(self, name):
+        return self.databases.find(name)
+
+    def list(self, identity, request_id):
+        self.reply(identity, LIST, request_id,
+                   [[database.name, json.dumps(database.options)]
+                    for database in self.databases])
+
+    def changes(self, identity, name, request_id, epoch, sequence, limit,
+                deadline=None):
+        database = self.find(name)
+        changelog = database.changelog
+        self.replicas.setdefault(identity, {})[name] = (sequence,
+                                                         time.time())
+        entries = None
+        if epoch == changelog.epoch:
+            # parked before reading the log, writes following the read
+            # are signalled
+            self.parked.add(name)
+            with database:
+                entries = changelog.since(sequence, limit)
+        if entries is None:
+            self.reply(identity, BEHIND, name, request_id)
+            return
+        if deadline is None:
+            deadline = time.time() + self.wait
+        if not entries and time.time() < deadline:
+            self.waiting.append((identity, name, request_id, epoch,
+                                 sequence, limit, deadline))
+            return
+        self.reply(identity, CHANGES, name, request_id, changelog.sequence,
+                   entries)
+
+    def snapshot(self, identity, name, request_id):
+        database = self.find(name)
+        database.acquire()
+        snapshot, (epoch, sequence) = database.sequenced_snapshot()
+        token = next(self._ids)
+        self.snapshots[token] = [database, snapshot, time.time()]
+        self.reply(identity, SNAPSHOT, name, request_id, token, epoch,
+                   sequence)
+
+    def snapshot_next(self, identity, name, request_id, token, after, limit):
+        if token not in self.snapshots:
+            self.reply(identity, BEHIND, name, request_id)
+            return
+        session = self.snapshots[token]
+        session[2] = time.time()
+        # the deadlines of the keys are replicated, not the log
+        iterator = session[1].iterator(start=after,
+                                       include_start=after is None)
+        items = []
+        size = 0
+        for key, value in iterator:
+            if is_log_key(key):
+                continue
+            items.append((key, value))
+            size += len(key) + len(value)
+            if len(items) >= limit or size >= PAGE_SIZE:
+                break
+        else:
+            self.close_snapshot(token)
+        iterator.close()
+        self.reply(identity, SNAPSHOT_NEXT, name, request_id, items,
+                   token not in self.snapshots)
+
+    def close_snapshot(self, token):
+        database, snapshot, _ = self.snapshots.pop(token)
+        snapshot.release()
+        database.release()
+
+    def reap(self):
+        deadline = time.time() - self.snapshot_timeout
+        for token, session in list(self.snapshots.items()):
+            if session[2] < deadline:
+                self.close_snapshot(token)
+
+    def stats(self):
+        sequences = {database.name: database.changelog.sequence
+                     for database in self.databases}
+        now = time.time()
+        replicas = {}
+        for identity, positions in list(self.replicas.items()):
+            replicas[identity.hex()] = {
+                name.decode(): {
+                    'sequence': sequence,
+                    'lag': sequences.get(name, sequence) - sequence,
+                    'last_seen': now - seen
+                } for name, (sequence, seen) in list(positions.items())
+            }
+        return {
+            'role': 'primary',
+            'snapshots': len(self.snapshots),
+            'replicas': replicas
+        }
+
+
+class Position(object):
+
+    def __init__(self):
+        self.epoch = None
+        self.sequence = 0
+        self.primary_sequence = 0
+        self.applied_at = None
+        self.request = None
+        self.request_id = None
+        self.sent = 0
+        self.received = 0
+        self.snapshots = 0
+        self.pending = None
+
+
+class Replica(Thread):
+
+    def __init__(self, databases, uri, batch_size=1000, timeout=5,
+                 *args, **kwargs):
+        super(Replica, self).__init__(*args, **kwargs)
+        self.daemon = True
+
+        self.context = zmq.Context.instance()
+        self.uri = uri
+        self.databases = databases
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.socket = None
+        self.positions = {}
+        self.listed = 0
+        self._ids = count(1)
+
+        self.handlers = {
+            LIST: self.on_list,
+            CHANGES: self.on_changes,
+            SNAPSHOT: self.on_snapshot,
+            SNAPSHOT_NEXT: self.on_snapshot_next,
+            BEHIND: self.on_behind
+        }
+
+    def run(self):
+        self.socket = self.context.socket(zmq.DEALER)
+        self.socket.connect(self.uri)
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+
+        while True:
+            if poller.poll(1000):
+                msg_type, payload = self.socket.recv_multipart()
+                args = protocol.msg.unpack_msg(payload)
+                try:
+                    self.handlers[msg_type](*args)
+                except Exception as e:
+                    print("replication error:", e)
+            now = time.time()
+            if now - self.listed > self.timeout:
+                self.listed = now
+                self.socket.send_multipart(pack(LIST, None))
+            # requests lost with a primary which went away are sent again
+            for name, position in self.positions.items():
+                if position.request and now - position.sent > self.timeout:
+                    self.send(name, *position.request)
+
+    def send(self, name, msg_type, *args):
+        position = self.positions[name]
+        position.request = (msg_type,) + args
+        position.request_id = next(self._ids)
+        position.sent = time.time()
+        self.socket.send_multipart(pack(msg_type, name, position.request_id,
+                                        *args))
+
+    def accept(self, name, request_id):
+        # replies to requests which were sent again are ignored
+        position = self.positions.get(name)
+        if position is None or position.request_id != request_id:
+            return None
+        position.received = time.time()
+        return position
+
+    def on_list(self, request_id, databases):
+        for name, options in databases:
+            if name in self.positions:
+                continue
+            self.databases.connect(name.decode(), True, json.loads(options))
+            self.positions[name] = Position()
+            self.send(name, SNAPSHOT)
+
+    def on_changes(self, name, request_id, primary_sequence, entries):
+        position = self.accept(name, request_id)
+        if position is None:
+            return
+        database = self.find(name)
+        with database:
+            for sequence, timestamp, ops in entries:
+                database.replay(ops)
+                position.sequence = sequence
+                position.applied_at = timestamp
+        position.primary_sequence = primary_sequence
+        self.send(name, CHANGES, position.epoch, position.sequence,
+                  self.batch_size)
+
+    def on_behind(self, name, request_id):
+        position = self.accept(name, request_id)
+        if position is not None:
+            self.send(name, SNAPSHOT)
+
+    def on_snapshot(self, name, request_id, token, epoch, sequence):
+        position = self.accept(name, request_id)
+        if position is None:
+            return
+        print("replicating {} from a snapshot".format(name.decode()))
+        position.snapshots += 1
+        position.pending = (epoch, sequence)
+        with self.find(name) as database:
+            database.clear()
+        self.send(name, SNAPSHOT_NEXT, token, None, self.batch_size)
+
+    def on_snapshot_next(self, name, request_id, items, done):
+        position = self.accept(name, request_id)
+        if position is None:
+            return
+        with self.find(name) as database:
+            database.replay(items)
+        token = position.request[1]
+        if not done:
+            self.send(name, SNAPSHOT_NEXT, token, items[-1][0],
+                      self.batch_size)
+            return
+        position.epoch, position.sequence = position.pending
+        position.primary_sequence = position.sequence
+        position.applied_at = time.time()
+        self.send(name, CHANGES, position.epoch, position.sequence,
+                  self.batch_size)
+
+    def notify(self, name):
+        # replicas are not replicated from
+        pass
+
+    def find(self, name):
+        return self.databases.find(name)
+
+    def stats(self):
+        now = time.time()
+        databases = {}
+        for name, position in list(self.positions.items()):
+            lag = position.primary_sequence - position.sequence
+            databases[name.decode()] = {
+                'synced': position.epoch is not None,
+                'sequence': position.sequence,
+                'primary_sequence': position.primary_sequence,
+                'lag': lag,
+                'delay': (now - position.applied_at
+                          if lag and position.applied_at else 0),
+                'snapshots': position.snapshots,
+                'last_contact': now - position.received
+            }
+        return {
+            'role': 'replica',
+            'primary': self.uri,
+            'databases': databases
+        }
@@ -0,0 +1,122 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import zmq
+import zmq.asyncio
+
+from . import protocol
+from .worker import Worker, Multipart, error_response, reject
+
+
+def split_envelope(msg):
+    for delimiter, frame in enumerate(msg):
+        if not len(frame):
+            return msg[:delimiter + 1], msg[delimiter + 1:]
+    raise ValueError("missing envelope delimiter")
+
+
+class Router(Worker):
+
+    def __init__(self, databases, uri, nb_threads=8, *args, **kwargs):
+        super(Router, self).__init__(databases, uri, *args, **kwargs)
+
+        self.context = zmq.asyncio.Context.shadow(self.context.underlying)
+        self.executor = ThreadPoolExecutor(nb_threads)
+        self.loop = None
+        self.pending = 0
+
+        self.blocking_commands = {
+            protocol.cmd.RANGE,
+            protocol.cmd.BATCH,
+            protocol.cmd.ITER_NEXT,
+            protocol.cmd.MULTI_GET,
+            protocol.cmd.MULTI_EXISTS,
+            protocol.cmd.CHANGES_SINCE
+        }
+        if databases.group_commit_window:
+            self.blocking_commands.update((protocol.cmd.PUT,
+                                           protocol.cmd.DELETE,
+                                           protocol.cmd.INCR,
+                                           protocol.cmd.CAS))
+
+        # position of the durability argument of the write commands
+        self.write_commands = {
+            protocol.cmd.PUT: 2,
+            protocol.cmd.DELETE: 1,
+            protocol.cmd.INCR: 2,
+            protocol.cmd.CAS: 3
+        }
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        finally:
+            self.executor.shutdown(wait=False)
+            self.loop.close()
+
+    async def serve(self):
+        self.socket = self.context.socket(zmq.ROUTER)
+        self.socket.bind(self.uri)
+
+        while True:
+            try:
+                envelope, frames = split_envelope(
+                    await self.socket.recv_multipart(copy=False))
+            except ValueError:
+                print("malformed request")
+                continue
+            try:
+                self.serve_request(envelope, frames)
+            except Exception as e:
+                # never let a client's request stop the loop
+                print("malformed request:", e)
+                self.reply(envelope, reject(frames))
+
+    def serve_request(self, envelope, frames):
+        cmd, uid, args, parts, request_id, flags = self.parse(frames)
+        # requests carrying extra frames (batches, raw values) may be
+        # large, keep them off the event loop
+        if parts or self.is_blocking(cmd, uid, args):
+            self.pending += 1
+            future = self.loop.run_in_executor(
+                self.executor, self.handle,
+                cmd, uid, args, parts, request_id, flags)
+            future.add_done_callback(
+                lambda f: self.done(envelope, f, request_id, flags))
+        else:
+            self.reply(envelope, self.handle(cmd, uid, args, parts,
+                                             request_id, flags))
+
+    def is_blocking(self, cmd, uid, args):
+        if cmd in self.blocking_commands:
+            return True
+        position = self.write_commands.get(cmd)
+        if position is None:
+            return False
+        durability = args[position] if len(args) > position else None
+        if durability is None:
+            try:
+                durability = self.databases.get(uid).options['durability']
+            except Exception:
+                return False
+        return durability == protocol.durability.SYNC
+
+    def queued(self):
+        return self.pending
+
+    def done(self, envelope, future, request_id=None, flags=None):
+        self.pending -= 1
+        try:
+            resp = future.result()
+        except Exception as e:
+            print("error:", e)
+            resp = error_response(request_id, flags)
+        self.reply(envelope, resp)
+
+    def reply(self, envelope, resp):
+        if isinstance(resp, Multipart):
+            self.socket.send_multipart(envelope + resp, copy=False)
+        else:
+            self.socket.send_multipart(envelope + [resp], copy=False)
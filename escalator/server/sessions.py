@@ -0,0 +1,151 @@
+import time
+from itertools import count, islice
+from threading import Lock, Thread
+
+from . import keyspace
+from .keyspace import MISSING
+
+
+class Session(object):
+    def __init__(self, db):
+        self.db = db
+        self.last_used = time.time()
+
+    def close(self):
+        pass
+
+
+class Cursor(Session):
+    def __init__(self, db, **kwargs):
+        super(Cursor, self).__init__(db)
+        self.include_key = kwargs.get('include_key', True)
+        self.include_value = kwargs.get('include_value', True)
+        db.acquire()
+        self.snapshot = db.snapshot()
+        self.iterator = keyspace.iterator(self.snapshot, **kwargs)
+        self.pending = MISSING
+        self.lock = Lock()
+
+    def next(self, size):
+        with self.lock:
+            if self.iterator is None:
+                return [], True
+            items = [] if self.pending is MISSING else [self.pending]
+            items.extend(islice(self.iterator, size - len(items)))
+            # items are None when neither keys nor values are included
+            self.pending = next(self.iterator, MISSING)
+            return items, self.pending is MISSING
+
+    def close(self):
+        with self.lock:
+            if self.iterator is not None:
+                self.iterator.close()
+                self.snapshot.release()
+                self.iterator = None
+                self.db.release()
+
+
+class Snapshot(Session):
+    def __init__(self, db):
+        super(Snapshot, self).__init__(db)
+        db.acquire()
+        self.snapshot, self.position = db.sequenced_snapshot()
+        self.readers = 0
+        self.closed = False
+        self.lock = Lock()
+
+    def __enter__(self):
+        with self.lock:
+            if self.closed:
+                raise Sessions.NotFound(self)
+            self.readers += 1
+        return self.snapshot
+
+    def __exit__(self, type, value, traceback):
+        with self.lock:
+            self.readers -= 1
+            release = self.closed and not self.readers
+        if release:
+            self._release()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            release = not self.readers
+        if release:
+            self._release()
+
+    def _release(self):
+        self.snapshot.release()
+        self.db.release()
+
+
+class Sessions(object):
+    class NotFound(KeyError):
+        pass
+
+    class LimitReached(Exception):
+        pass
+
+    def __init__(self, timeout=60, max_per_db=64):
+        self.timeout = timeout
+        self.max_per_db = max_per_db
+        self._sessions = {}
+        self._counts = {}
+        self._ids = count(1)
+        self._lock = Lock()
+        self._reaper = None
+
+    def open(self, session):
+        with self._lock:
+            opened = self._counts.get(session.db, 0)
+            if opened >= self.max_per_db:
+                session.close()
+                raise Sessions.LimitReached(self.max_per_db)
+            sid = next(self._ids)
+            self._sessions[sid] = session
+            self._counts[session.db] = opened + 1
+            if self._reaper is None:
+                self._reaper = Thread(target=self._reap_forever)
+                self._reaper.daemon = True
+                self._reaper.start()
+        return sid
+
+    def get(self, db, sid):
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is None or session.db is not db:
+                raise Sessions.NotFound(sid)
+            session.last_used = time.time()
+            return session
+
+    def close(self, db, sid):
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is None or session.db is not db:
+                raise Sessions.NotFound(sid)
+            self._remove(sid)
+        session.close()
+
+    def reap(self):
+        deadline = time.time() - self.timeout
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items()
+                       if session.last_used < deadline]
+            sessions = [self._remove(sid) for sid in expired]
+        for session in sessions:
+            session.close()
+
+    def _remove(self, sid):
+        session = self._sessions.pop(sid)
+        self._counts[session.db] -= 1
+        if not self._counts[session.db]:
+            del self._counts[session.db]
+        return session
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(self.timeout / 2)
+            self.reap()
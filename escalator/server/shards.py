@@ -0,0 +1,120 @@
+import zlib
+from multiprocessing import Process
+from threading import Thread
+
+import zmq
+
+from . import protocol
+from .databases import Databases
+from .router import Router, split_envelope
+from .worker import reject
+
+
+def shard_uri(port, shard, host='127.0.0.1'):
+    return 'tcp://{}:{}'.format(host, port + 1 + shard)
+
+
+def shard_watch_uri(port, nb_shards):
+    return 'tcp://127.0.0.1:{}'.format(port + 1 + nb_shards)
+
+
+def start_watch_proxy(uri, shards_uri):
+    context = zmq.Context.instance()
+    front = context.socket(zmq.XPUB)
+    front.bind(uri)
+    back = context.socket(zmq.XSUB)
+    back.bind(shards_uri)
+    thread = Thread(target=zmq.proxy, args=(front, back))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def serve_shard(working_dir, shard, nb_shards, uri, nb_threads, options):
+    databases = Databases(working_dir, shard, nb_shards, **options)
+    try:
+        Router(databases, uri, nb_threads).run()
+    except KeyboardInterrupt:
+        pass
+
+
+def start_shards(working_dir, nb_shards, port, nb_threads, host=None,
+                 **options):
+    shards = []
+    for shard in range(nb_shards):
+        uri = shard_uri(port, shard)
+        shard_options = options
+        if host is not None:
+            # CONNECT sends clients to the shard serving their database
+            uri = shard_uri(port, shard, '*')
+            shard_options = dict(options,
+                                 endpoint=shard_uri(port, shard, host))
+        process = Process(target=serve_shard,
+                          args=(working_dir, shard, nb_shards, uri,
+                                nb_threads, shard_options))
+        process.daemon = True
+        process.start()
+        shards.append(process)
+    return shards
+
+
+class Frontend(object):
+
+    def __init__(self, uri, shard_uris):
+        self.context = zmq.Context.instance()
+        self.uri = uri
+        self.shard_uris = shard_uris
+
+        self.name_commands = {
+            protocol.cmd.CREATE,
+            protocol.cmd.CONNECT
+        }
+
+    def route(self, frame):
+        nb_shards = len(self.shard_uris)
+        if protocol.v2.is_v2(frame):
+            cmd, uid, _, _ = protocol.v2.extract_header(frame)
+            if cmd in self.name_commands:
+                name = protocol.v2.extract_request(frame)[4][0]
+                return zlib.crc32(name) % nb_shards
+            return uid % nb_shards if uid is not None else 0
+        cmd, uid, unpacker = protocol.msg.extract_header(frame)
+        if cmd in self.name_commands:
+            unpacker.read_array_header()
+            return zlib.crc32(unpacker.unpack()) % nb_shards
+        if isinstance(uid, int):
+            return uid % nb_shards
+        return 0
+
+    def run(self):
+        front = self.context.socket(zmq.ROUTER)
+        front.bind(self.uri)
+
+        poller = zmq.Poller()
+        poller.register(front, zmq.POLLIN)
+
+        backends = []
+        for uri in self.shard_uris:
+            backend = self.context.socket(zmq.DEALER)
+            backend.connect(uri)
+            poller.register(backend, zmq.POLLIN)
+            backends.append(backend)
+
+        while True:
+            for socket, _ in poller.poll():
+                msg = socket.recv_multipart(copy=False)
+                if socket is not front:
+                    front.send_multipart(msg, copy=False)
+                    continue
+                try:
+                    envelope, frames = split_envelope(msg)
+                except ValueError:
+                    print("malformed request")
+                    continue
+                try:
+                    shard = self.route(frames[0].bytes)
+                except Exception as e:
+                    print("malformed request:", e)
+                    front.send_multipart(envelope + [reject(frames)])
+                    continue
+                backends[shard].send_multipart(msg, copy=False)
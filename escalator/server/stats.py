@@ -0,0 +1,112 @@
+import time
+from threading import Lock, local
+
+# latencies are recorded in microseconds with 4 significant bits, so that
+# each bucket is at most 1/16th of its value wide
+SUB_BUCKETS = 16
+SUB_BUCKET_BITS = 4
+
+
+def bucket_index(value):
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def bucket_value(index):
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return (SUB_BUCKETS + index % SUB_BUCKETS) << shift
+
+
+class Histogram(object):
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.errors = 0
+
+    def record(self, value, error=False):
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if error:
+            self.errors += 1
+
+    def merge(self, other):
+        for index, count in other.counts.copy().items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.errors += other.errors
+
+    def percentile(self, percent):
+        threshold = self.count * percent / 100.
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= threshold:
+                return bucket_value(index)
+        return 0
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'mean': self.total // self.count if self.count else 0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'max': self.max
+        }
+
+
+class Recorder(object):
+    def __init__(self):
+        self.histograms = {}
+        self.started = 0
+        self.finished = 0
+
+
+class Stats(object):
+    def __init__(self):
+        self.start_time = time.time()
+        self._recorders = []
+        self._local = local()
+        self._lock = Lock()
+
+    def recorder(self):
+        try:
+            return self._local.recorder
+        except AttributeError:
+            recorder = self._local.recorder = Recorder()
+            with self._lock:
+                self._recorders.append(recorder)
+            return recorder
+
+    def record(self, recorder, cmd, database, start, error=False):
+        elapsed = int((time.time() - start) * 1000000)
+        key = (cmd, database)
+        histogram = recorder.histograms.get(key)
+        if histogram is None:
+            histogram = recorder.histograms[key] = Histogram()
+        histogram.record(elapsed, error)
+
+    def merged(self):
+        histograms = {}
+        with self._lock:
+            recorders = list(self._recorders)
+        for recorder in recorders:
+            for key, histogram in recorder.histograms.copy().items():
+                if key not in histograms:
+                    histograms[key] = Histogram()
+                histograms[key].merge(histogram)
+        return histograms, sum(r.started - r.finished for r in recorders)
@@ -0,0 +1,104 @@
+import struct
+from threading import Lock, Thread, local
+
+import zmq
+
+# sequence number of the event in its database, number of events of the
+# database dropped so far, operation
+HEADER = struct.Struct('!QQc')
+
+PUT = b'p'
+DELETE = b'd'
+
+
+def topic(name, key):
+    return name + b'\x00' + key
+
+
+class Publisher(Thread):
+
+    def __init__(self, uri, bind=True, values=False, hwm=1000,
+                 *args, **kwargs):
+        super(Publisher, self).__init__(*args, **kwargs)
+        self.daemon = True
+
+        self.context = zmq.Context.instance()
+        self.uri = uri
+        self.bind = bind
+        self.values = values
+        self.hwm = hwm
+        self.queue_uri = 'inproc://escalator-watch-{}'.format(id(self))
+        self.queue = self.context.socket(zmq.PULL)
+        self.queue.rcvhwm = hwm
+        self.queue.bind(self.queue_uri)
+
+        self.published = 0
+        self.dropped = 0
+        self._sequences = {}
+        self._drops = {}
+        self._lock = Lock()
+        self._local = local()
+
+    def _socket(self):
+        try:
+            return self._local.socket
+        except AttributeError:
+            socket = self._local.socket = self.context.socket(zmq.PUSH)
+            socket.sndhwm = self.hwm
+            socket.connect(self.queue_uri)
+            return socket
+
+    def publish(self, name, ops):
+        frames = [name]
+        for key, value in ops:
+            frames.append(key)
+            if value is None:
+                frames.append(DELETE)
+            else:
+                frames.append(PUT)
+                if self.values:
+                    frames.append(value)
+        try:
+            # never block writers, events which do not fit in the buffer
+            # are counted and reported to the subscribers
+            self._socket().send_multipart(frames, zmq.NOBLOCK, copy=False)
+        except zmq.Again:
+            with self._lock:
+                self._drops[name] = self._drops.get(name, 0) + len(ops)
+                self.dropped += len(ops)
+
+    def run(self):
+        socket = self.context.socket(zmq.PUB)
+        socket.sndhwm = self.hwm
+        if self.bind:
+            socket.bind(self.uri)
+        else:
+            socket.connect(self.uri)
+
+        while True:
+            frames = self.queue.recv_multipart()
+            name = frames[0]
+            sequence, dropped = self._sequences.get(name, (0, 0))
+            if self._drops:
+                with self._lock:
+                    lost = self._drops.pop(name, 0)
+                sequence += lost
+                dropped += lost
+            i = 1
+            while i < len(frames):
+                key, op = frames[i], frames[i + 1]
+                i += 2
+                sequence += 1
+                msg = [topic(name, key), HEADER.pack(sequence, dropped, op)]
+                if op == PUT and self.values:
+                    msg.append(frames[i])
+                    i += 1
+                socket.send_multipart(msg)
+                self.published += 1
+            self._sequences[name] = (sequence, dropped)
+
+    def stats(self):
+        return {
+            'published': self.published,
+            'dropped': self.dropped
+        }
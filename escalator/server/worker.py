@@ -1,14 +1,82 @@
-from threading import Thread
+import time
+from itertools import islice
+from threading import Thread, local
 
 import zmq
 
+from . import keyspace
 from . import protocol
+from .keyspace import prefix_end
+from .query import Query
+from .sessions import Cursor, Sessions, Snapshot
+from .stats import Histogram
 
 
 class Multipart(list):
     pass
 
 
+def error_response(request_id=None, flags=None):
+    return protocol.msg.pack_response(
+        protocol.msg.format_response(status=protocol.status.ERROR),
+        request_id, flags)
+
+
+def reject(frames):
+    # answered in the version of the request when its header is valid
+    request_id = flags = None
+    msg = frames[0].bytes if frames else b''
+    if protocol.v2.is_v2(msg):
+        try:
+            _, _, request_id, flags = protocol.v2.extract_header(msg)
+        except Exception:
+            pass
+    return error_response(request_id, flags)
+
+
+def check_ttl(ttl):
+    if ttl is not None and not (isinstance(ttl, (int, float)) and ttl > 0):
+        raise TypeError(ttl)
+
+
+def is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# the options a database may define, and the values they accept
+DB_OPTIONS = {
+    'durability': lambda v: v in protocol.durability.LEVELS,
+    'codec': lambda v: v in protocol.codec.CODECS,
+    'compression_level': lambda v: is_integer(v) and -1 <= v <= 9,
+    'compression_threshold': lambda v: is_integer(v) and v >= 0
+}
+
+
+def check_options(options):
+    options = {key.decode(): value for key, value in options.items()}
+    if isinstance(options.get('codec'), bytes):
+        options['codec'] = options['codec'].decode()
+    for key, value in options.items():
+        if key not in DB_OPTIONS or not DB_OPTIONS[key](value):
+            raise TypeError(options)
+    return options
+
+
+def same_value(value, expected, pack):
+    if value is None or expected is None:
+        return value is expected
+    if value == expected:
+        return True
+    if not pack:
+        return False
+    # equal values may be packed differently
+    try:
+        return protocol.msg.unpack_msg(value) == \
+            protocol.msg.unpack_msg(expected)
+    except Exception:
+        return False
+
+
 class Worker(Thread):
 
     def __init__(self, databases, uri, *args, **kwargs):
@@ -19,10 +87,12 @@ class Worker(Thread):
         self.socket = None
 
         self.databases = databases
+        self._local = local()
 
         self.db_commands = {
             protocol.cmd.CREATE: self.create,
-            protocol.cmd.CONNECT: self.connect
+            protocol.cmd.CONNECT: self.connect,
+            protocol.cmd.STATS: self.stats
         }
 
         self.commands = {
@@ -31,12 +101,31 @@ class Worker(Thread):
             protocol.cmd.PUT: self.put,
             protocol.cmd.DELETE: self.delete,
             protocol.cmd.RANGE: self.range,
-            protocol.cmd.BATCH: self.batch
+            protocol.cmd.BATCH: self.batch,
+            protocol.cmd.ITER_OPEN: self.iter_open,
+            protocol.cmd.ITER_NEXT: self.iter_next,
+            protocol.cmd.ITER_CLOSE: self.iter_close,
+            protocol.cmd.MULTI_GET: self.multi_get,
+            protocol.cmd.MULTI_EXISTS: self.multi_exists,
+            protocol.cmd.SNAPSHOT_OPEN: self.snapshot_open,
+            protocol.cmd.SNAPSHOT_RELEASE: self.snapshot_release,
+            protocol.cmd.CHANGES_SINCE: self.changes_since,
+            protocol.cmd.INCR: self.incr,
+            protocol.cmd.CAS: self.cas
+        }
+
+        # refused by replicas, their databases follow the primary's
+        self.mutating_commands = {
+            protocol.cmd.PUT,
+            protocol.cmd.DELETE,
+            protocol.cmd.BATCH,
+            protocol.cmd.INCR,
+            protocol.cmd.CAS
         }
 
         self.batch_commands = {
-            protocol.cmd.PUT: self.put,
-            protocol.cmd.DELETE: self.delete
+            protocol.cmd.PUT: self.batch_put,
+            protocol.cmd.DELETE: self.batch_delete
         }
 
     def run(self):
@@ -44,48 +133,121 @@ class Worker(Thread):
         self.socket.connect(self.uri)
 
         while True:
-            cmd, uid, args = protocol.msg.extract_request(self.socket.recv())
-            try:
-                if cmd in self.db_commands:
-                    db = None
-                else:
-                    db = self.databases.get(uid)
-            except:
-                resp = protocol.msg.format_response(
-                    uid, status=protocol.status.NO_DB)
-            else:
-                if db:
-                    resp = self.handle_cmd(db, self.commands, cmd, args)
-                else:
-                    resp = self.handle_cmd(None, self.db_commands, cmd, args)
+            resp = self.process(self.socket.recv_multipart(copy=False))
             if isinstance(resp, Multipart):
-                self.socket.send_multipart(resp)
+                self.socket.send_multipart(resp, copy=False)
             else:
                 self.socket.send(resp)
 
-    def handle_cmd(self, db, commands, cmd, args):
+    def process(self, frames):
+        try:
+            request = self.parse(frames)
+        except Exception as e:
+            print("malformed request:", e)
+            return reject(frames)
+        return self.handle(*request)
+
+    def parse(self, frames):
+        msg = frames[0].bytes
+        parts = [frame.buffer for frame in frames[1:]]
+        if protocol.v2.is_v2(msg):
+            cmd, uid, request_id, flags, args = \
+                protocol.v2.extract_request(msg)
+        else:
+            cmd, uid, args = protocol.msg.extract_request(msg)
+            request_id = flags = None
+        return cmd, uid, args, parts, request_id, flags
+
+    def handle(self, cmd, uid, args, parts, request_id=None, flags=None):
+        self._local.tagged = request_id is not None
+        try:
+            resp = self.dispatch(cmd, uid, args, parts)
+            if isinstance(resp, Multipart):
+                resp[0] = protocol.msg.pack_response(resp[0], request_id,
+                                                     flags)
+                return resp
+            return protocol.msg.pack_response(resp, request_id, flags)
+        except Exception as e:
+            # including responses which can not be encoded
+            print("error:", e)
+            return error_response(request_id, flags)
+
+    def dispatch(self, cmd, uid, args, parts=()):
+        try:
+            if cmd in self.db_commands:
+                db = None
+            else:
+                db = self.databases.get(uid)
+        except:
+            return protocol.msg.format_response(
+                uid, status=protocol.status.NO_DB)
+        if db is None:
+            return self.handle_cmd(None, self.db_commands, cmd, args)
+        if self.databases.read_only and cmd in self.mutating_commands:
+            return protocol.msg.format_response(
+                cmd, status=protocol.status.READ_ONLY)
+        try:
+            db.acquire()
+        except Exception as e:
+            print('database error:', e)
+            return protocol.msg.format_response(
+                uid, status=protocol.status.DB_ERROR)
+        try:
+            return self.handle_cmd(db, self.commands, cmd, args, parts)
+        finally:
+            db.release()
+
+    def handle_cmd(self, db, commands, cmd, args, parts=()):
         cb = commands.get(cmd)
         if cb:
+            kwargs = {'parts': parts} if parts else {}
+            recorder = self.databases.stats.recorder()
+            recorder.started += 1
+            start = time.time()
+            error = True
             try:
-                resp = cb(db, *args) if db is not None else cb(*args)
+                resp = (cb(db, *args, **kwargs) if db is not None
+                        else cb(*args, **kwargs))
+                error = False
             except TypeError:
                 print("invalid args")
                 resp = protocol.msg.format_response(
                     cmd, status=protocol.status.INVALID_ARGS)
+            except Exception as e:
+                print("error:", e)
+                resp = protocol.msg.format_response(
+                    status=protocol.status.ERROR)
+            self.databases.stats.record(recorder, cmd,
+                                        db.path if db else None,
+                                        start, error)
+            recorder.finished += 1
         else:
             print("bad command")
             resp = protocol.msg.format_response(
                 cmd, status=protocol.status.CMD_NOT_FOUND)
         return resp
 
-    def create(self, name):
-        return self.connect(name, True)
+    def create(self, name, options=None):
+        return self.connect(name, True, options)
 
-    def connect(self, name, create):
+    def connect(self, name, create, options=None, version=None):
         name = name.decode()
+        if options:
+            options = check_options(options)
+        if create and self.databases.read_only:
+            return protocol.msg.format_response(
+                protocol.cmd.CREATE, status=protocol.status.READ_ONLY)
         try:
-            uid = self.databases.connect(name, create)
-            resp = protocol.msg.format_response(uid, status=protocol.status.OK)
+            uid = self.databases.connect(name, create, options)
+            if version is None:
+                resp = protocol.msg.format_response(uid)
+            else:
+                # negotiate the highest protocol version both sides speak
+                args = (uid, min(version, protocol.v2.VERSION))
+                if self.databases.endpoint is not None:
+                    # the client may skip the frontend of sharded servers
+                    args += (self.databases.endpoint,)
+                resp = protocol.msg.format_response(*args)
         except self.databases.NotExistError as e:
             print('database does not exist:', e)
             resp = protocol.msg.format_response(
@@ -96,45 +258,275 @@ class Worker(Thread):
                 name, status=protocol.status.DB_ERROR)
         return resp
 
-    def get(self, db, key):
+    def sends_encoded(self):
+        # version 1 clients predate the codecs, they get decoded values
+        return getattr(self._local, 'tagged', True)
+
+    def with_snapshot(self, db, snapshot_id, handler, *args):
+        try:
+            with self.databases.snapshots.get(db, snapshot_id) as snapshot:
+                return handler(snapshot, *args)
+        except Sessions.NotFound:
+            return protocol.msg.format_response(
+                snapshot_id, status=protocol.status.SNAPSHOT_NOT_FOUND)
+
+    def queued(self):
+        return 0
+
+    def stats(self):
+        histograms, in_flight = self.databases.stats.merged()
+        commands = {}
+        databases = {database.path: database.stats()
+                     for database in self.databases}
+        for (cmd, name), histogram in histograms.items():
+            cmd = protocol.cmd.get_command(cmd)
+            commands.setdefault(cmd, Histogram()).merge(histogram)
+            if name is not None:
+                databases[name]['commands'][cmd] = histogram.summary()
+        stats = {
+            'uptime': time.time() - self.databases.stats.start_time,
+            'in_flight': in_flight,
+            'queued': self.queued(),
+            'commands': {cmd: histogram.summary()
+                         for cmd, histogram in commands.items()},
+            'databases': databases
+        }
+        if self.databases.publisher is not None:
+            stats['watch'] = self.databases.publisher.stats()
+        if self.databases.replication is not None:
+            stats['replication'] = self.databases.replication.stats()
+        return protocol.msg.format_response(stats)
+
+    def get(self, db, key, snapshot=None, raw=False):
+        if snapshot is not None:
+            return self.with_snapshot(db, snapshot, self.get, key, None, raw)
         value = db.get(key)
         if value is None:
             return protocol.msg.format_response(
                 key, status=protocol.status.KEY_NOT_FOUND)
+        value = protocol.codec.decode(value, not self.sends_encoded())
+        if raw and len(value) >= protocol.msg.RAW_THRESHOLD:
+            return Multipart([protocol.msg.format_response(), value])
         return protocol.msg.format_response(value)
 
-    def exists(self, db, key):
+    def exists(self, db, key, snapshot=None):
+        if snapshot is not None:
+            return self.with_snapshot(db, snapshot, self.exists, key)
         value = db.get(key)
         return protocol.msg.format_response(value is not None)
 
-    def put(self, db, key, value):
-        db.put(key, value)
+    def multi_get(self, db, keys, snapshot=None):
+        if snapshot is not None:
+            return self.with_snapshot(db, snapshot, self.multi_get, keys)
+        decode = not self.sends_encoded()
+        return protocol.msg.format_response(*[
+            value if value is None else protocol.codec.decode(value, decode)
+            for value in map(db.get, keys)])
+
+    def multi_exists(self, db, keys, snapshot=None):
+        if snapshot is not None:
+            return self.with_snapshot(db, snapshot, self.multi_exists, keys)
+        return protocol.msg.format_response(*[db.get(key) is not None
+                                              for key in keys])
+
+    def put(self, db, key, value, durability=None, ttl=None, parts=()):
+        if parts:
+            value = parts[0]
+        check_ttl(ttl)
+        db.put(key, value, durability, ttl)
         return protocol.msg.format_response()
 
-    def delete(self, db, key):
-        db.delete(key)
+    def delete(self, db, key, durability=None):
+        db.delete(key, durability)
         return protocol.msg.format_response()
 
+    def incr(self, db, key, delta=1, durability=None):
+        if not is_integer(delta):
+            raise TypeError(delta)
+        with db.key_lock(key):
+            value = db.get(key)
+            current = 0
+            if value is not None:
+                try:
+                    current = protocol.msg.unpack_msg(
+                        protocol.codec.decode(value))
+                except Exception:
+                    current = None
+                if not is_integer(current):
+                    return protocol.msg.format_response(
+                        key, status=protocol.status.NOT_AN_INTEGER)
+            current += delta
+            # the key keeps its TTL
+            db.put(key, protocol.msg.pack_arg(current), durability,
+                   db.ttl(key))
+        return protocol.msg.format_response(current)
+
+    def cas(self, db, key, expected, new, durability=None, pack=True):
+        # a missing key is expected as None, new as None deletes the key
+        with db.key_lock(key):
+            value = db.get(key)
+            if value is not None:
+                value = protocol.codec.decode(value)
+            if not same_value(value, expected, pack):
+                return protocol.msg.format_response(False, value)
+            if new is None:
+                db.delete(key, durability)
+            else:
+                db.put(key, new, durability, db.ttl(key))
+        return protocol.msg.format_response(True, None)
+
     def range(self, db,
               prefix, start, stop,
               include_start, include_stop,
               include_key, include_value,
-              reverse):
-        values = Multipart(protocol.msg.pack_arg(v) for v in
-                           db.iterator(prefix=prefix,
-                                       start=start,
-                                       stop=stop,
-                                       include_start=include_start,
-                                       include_stop=include_stop,
-                                       include_key=include_key,
-                                       include_value=include_value,
-                                       reverse=reverse))
-        values.insert(0, protocol.msg.format_response())
+              reverse, limit=None, token=None, snapshot=None,
+              where=None, fields=None):
+        if snapshot is not None:
+            return self.with_snapshot(db, snapshot, self.range,
+                                      prefix, start, stop,
+                                      include_start, include_stop,
+                                      include_key, include_value,
+                                      reverse, limit, token, None,
+                                      where, fields)
+        query = None
+        if where or fields is not None and include_value:
+            query = Query(where, fields)
+        if token is not None:
+            if prefix is not None:
+                start, stop = prefix, prefix_end(prefix)
+                include_start, include_stop = True, False
+                prefix = None
+            if reverse:
+                stop, include_stop = token, False
+            else:
+                start, include_start = token, False
+        iterator = keyspace.iterator(db, prefix=prefix,
+                                     start=start,
+                                     stop=stop,
+                                     include_start=include_start,
+                                     include_stop=include_stop,
+                                     include_key=True,
+                                     include_value=(include_value or
+                                                    query is not None),
+                                     reverse=reverse)
+        if query is not None:
+            # filtered and projected before being sent, the limit and the
+            # token apply to the matching items
+            iterator = query.filter(iterator, include_value)
+        values = Multipart([None])
+        key = None
+        decode = include_value and not self.sends_encoded()
+        for item in islice(iterator, limit):
+            key = item[0] if include_value else item
+            if not include_value:
+                # one None per item when neither is included, as plyvel
+                item = key if include_key else None
+            else:
+                value = item[1]
+                if decode:
+                    value = protocol.codec.decode(value)
+                item = (key, value) if include_key else value
+            values.append(protocol.msg.pack_arg(item))
+        if limit is None or len(values) <= limit or \
+           next(iterator, None) is None:
+            key = None
+        values[0] = protocol.msg.format_response(key)
+        return values
+
+    def batch(self, db, transaction, durability=None, parts=()):
+        with db.write_batch(transaction, durability) as wb:
+            for part in parts:
+                cmd, _, args = protocol.msg.extract_request(part)
+                self.batch_commands[cmd](wb, *args)
+        return protocol.msg.format_response()
+
+    def batch_put(self, wb, key, value, ttl=None):
+        check_ttl(ttl)
+        wb.put(key, value, ttl)
+
+    def batch_delete(self, wb, key):
+        wb.delete(key)
+
+    def iter_open(self, db,
+                  prefix, start, stop,
+                  include_start, include_stop,
+                  include_key, include_value,
+                  reverse):
+        cursor = Cursor(db,
+                        prefix=prefix,
+                        start=start,
+                        stop=stop,
+                        include_start=include_start,
+                        include_stop=include_stop,
+                        include_key=include_key,
+                        include_value=include_value,
+                        reverse=reverse)
+        try:
+            cursor_id = self.databases.cursors.open(cursor)
+        except Sessions.LimitReached as e:
+            return protocol.msg.format_response(
+                *e.args, status=protocol.status.TOO_MANY_CURSORS)
+        return protocol.msg.format_response(cursor_id)
+
+    def iter_next(self, db, cursor_id, size):
+        try:
+            cursor = self.databases.cursors.get(db, cursor_id)
+        except Sessions.NotFound:
+            return protocol.msg.format_response(
+                cursor_id, status=protocol.status.CURSOR_NOT_FOUND)
+        items, exhausted = cursor.next(size)
+        if exhausted:
+            self.iter_close(db, cursor_id)
+        items = protocol.codec.decode_values(items, cursor.include_key,
+                                             cursor.include_value,
+                                             not self.sends_encoded())
+        values = Multipart(protocol.msg.pack_arg(item) for item in items)
+        values.insert(0, protocol.msg.format_response(exhausted))
         return values
 
-    def batch(self, db, transaction):
-        with db.write_batch(transaction=transaction) as wb:
-            while self.socket.get(zmq.RCVMORE):
-                cmd, _, args = protocol.msg.extract_request(self.socket.recv())
-                self.handle_cmd(wb, self.batch_commands, cmd, args)
+    def iter_close(self, db, cursor_id):
+        try:
+            self.databases.cursors.close(db, cursor_id)
+        except Sessions.NotFound:
+            return protocol.msg.format_response(
+                cursor_id, status=protocol.status.CURSOR_NOT_FOUND)
+        return protocol.msg.format_response()
+
+    def snapshot_open(self, db):
+        snapshot = Snapshot(db)
+        try:
+            snapshot_id = self.databases.snapshots.open(snapshot)
+        except Sessions.LimitReached as e:
+            return protocol.msg.format_response(
+                *e.args, status=protocol.status.TOO_MANY_SNAPSHOTS)
+        # the position of the change log the snapshot matches
+        return protocol.msg.format_response(snapshot_id,
+                                            *snapshot.position or ())
+
+    def snapshot_release(self, db, snapshot_id):
+        try:
+            self.databases.snapshots.close(db, snapshot_id)
+        except Sessions.NotFound:
+            return protocol.msg.format_response(
+                snapshot_id, status=protocol.status.SNAPSHOT_NOT_FOUND)
         return protocol.msg.format_response()
+
+    def changes_since(self, db, sequence, limit=1000, epoch=None):
+        if db.changelog is None:
+            return protocol.msg.format_response(
+                db.name, status=protocol.status.NO_CHANGELOG)
+        entries = None
+        if epoch is None or epoch == db.changelog.epoch:
+            entries = db.changelog.since(sequence, limit)
+        if entries is None:
+            return protocol.msg.format_response(
+                sequence, status=protocol.status.CHANGES_UNAVAILABLE)
+        # deadlines of the keys are written along with them
+        decode = not self.sends_encoded()
+        entries = [(entry_sequence, timestamp,
+                    [(key, value if value is None
+                      else protocol.codec.decode(value, decode))
+                     for key, value in ops if not keyspace.is_reserved(key)])
+                   for entry_sequence, timestamp, ops in entries]
+        return protocol.msg.format_response(db.changelog.epoch,
+                                            db.changelog.sequence, entries)
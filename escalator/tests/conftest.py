@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests import the packages of escalator/, wherever pytest runs from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
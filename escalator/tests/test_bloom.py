@@ -0,0 +1,27 @@
+import unittest
+
+from server.bloom import BloomFilter
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_contains(self):
+        bloom = BloomFilter(0.01, 16)
+        keys = [str(i).encode() for i in range(100)]
+        for key in keys:
+            bloom.add(key)
+        for key in keys:
+            self.assertIn(key, bloom)
+        self.assertGreater(len(bloom.filters), 1)
+
+    def test_rewrites(self):
+        bloom = BloomFilter(0.01, 16)
+        for _ in range(1000):
+            bloom.add(b'samekey')
+        stats = bloom.stats()
+        self.assertEqual(stats['filters'], 1)
+        self.assertEqual(stats['keys'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from server.cache import Cache
+
+
+class TestCache(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = Cache(100)
+        value, generation = cache.get(b'k')
+        self.assertIsNone(value)
+        cache.set(b'k', b'v', generation)
+        self.assertEqual(cache.get(b'k')[0], b'v')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_eviction(self):
+        cache = Cache(10)
+        generation = cache.get(b'a')[1]
+        cache.set(b'a', b'1234', generation)
+        cache.set(b'b', b'1234', generation)
+        # a is used last, b goes first
+        cache.get(b'a')
+        cache.set(b'c', b'1234', generation)
+        self.assertEqual(cache.get(b'a')[0], b'1234')
+        self.assertIsNone(cache.get(b'b')[0])
+        self.assertEqual(cache.size, 10)
+        cache.set(b'd', b'x' * 20, generation)
+        self.assertIsNone(cache.get(b'd')[0])
+
+    def test_invalidate(self):
+        cache = Cache(100)
+        generation = cache.get(b'k')[1]
+        cache.set(b'k', b'v', generation)
+        cache.invalidate([b'k'])
+        self.assertIsNone(cache.get(b'k')[0])
+        # values read before a write are not cached after it
+        cache.set(b'k', b'old', generation)
+        self.assertIsNone(cache.get(b'k')[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
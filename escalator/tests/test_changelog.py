@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+import unittest
+
+import plyvel
+
+from server.changelog import Changelog, entry_size
+
+
+class TestChangelog(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = plyvel.DB(self.path, create_if_missing=True)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.path)
+
+    def write(self, changelog, count):
+        for i in range(count):
+            ops = [(b'k%d' % i, b'v' * 10)]
+            entry = changelog.next_entry(ops)
+            with self.db.write_batch() as wb:
+                for key, value in ops + list(changelog.records(entry)):
+                    if value is None:
+                        wb.delete(key)
+                    else:
+                        wb.put(key, value)
+            changelog.append(entry)
+
+    def sequences(self, entries):
+        return [entry[0] for entry in entries]
+
+    def test_memory(self):
+        changelog = Changelog(size=3)
+        changelog.open(self.db)
+        self.write(changelog, 5)
+        self.assertEqual(changelog.first(), 3)
+        self.assertEqual(self.sequences(changelog.since(2, 10)), [3, 4, 5])
+        self.assertEqual(self.sequences(changelog.since(3, 1)), [4])
+        self.assertEqual(changelog.since(5, 10), [])
+        self.assertIsNone(changelog.since(1, 10))
+
+    def test_disk(self):
+        changelog = Changelog(size=2, retention=4)
+        changelog.open(self.db)
+        self.write(changelog, 6)
+        # entries 3 and 4 come from disk, 5 and 6 from memory
+        self.assertEqual(self.sequences(changelog.since(2, 10)), [3, 4, 5, 6])
+        self.assertEqual(self.sequences(changelog.since(4, 10)), [5, 6])
+        self.assertIsNone(changelog.since(1, 10))
+        entries = changelog.since(2, 10)
+        self.assertEqual([tuple(op) for op in entries[0][2]],
+                         [(b'k2', b'v' * 10)])
+
+    def test_max_bytes(self):
+        changelog = Changelog(size=10)
+        changelog.open(self.db)
+        self.write(changelog, 5)
+        size = entry_size(changelog.since(0, 1)[0])
+        self.assertEqual(len(changelog.since(0, 10, 2 * size)), 2)
+        # at least one entry, however large
+        self.assertEqual(len(changelog.since(0, 10, 1)), 1)
+
+    def test_reopen(self):
+        changelog = Changelog(retention=10)
+        changelog.open(self.db)
+        self.write(changelog, 3)
+        reopened = Changelog(retention=10)
+        reopened.open(self.db)
+        self.assertEqual((reopened.epoch, reopened.sequence),
+                         (changelog.epoch, 3))
+        self.assertEqual(self.sequences(reopened.since(0, 10)), [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
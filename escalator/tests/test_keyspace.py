@@ -0,0 +1,58 @@
+import shutil
+import tempfile
+import unittest
+
+import plyvel
+
+from server import keyspace
+
+
+class TestIterator(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = plyvel.DB(self.path, create_if_missing=True)
+        for key in (b'a', b'b', b'c', b'\xff\xff\xff'):
+            self.db.put(key, key.upper())
+        self.db.put(keyspace.reserved(b'test') + b'x', b'hidden')
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.path)
+
+    def keys(self, **kwargs):
+        iterator = keyspace.iterator(self.db, include_value=False, **kwargs)
+        keys = list(iterator)
+        iterator.close()
+        return keys
+
+    def test_reserved_hidden(self):
+        self.assertEqual(self.keys(), [b'a', b'b', b'c', b'\xff\xff\xff'])
+        self.assertEqual(self.keys(reverse=True),
+                         [b'\xff\xff\xff', b'c', b'b', b'a'])
+        self.assertEqual(self.keys(prefix=b'\xff'), [b'\xff\xff\xff'])
+        self.assertEqual(self.keys(prefix=keyspace.RESERVED), [])
+
+    def test_bounds(self):
+        self.assertEqual(self.keys(start=b'a', stop=b'c'), [b'a', b'b'])
+        self.assertEqual(self.keys(start=b'a', stop=b'c', include_start=False,
+                                   include_stop=True), [b'b', b'c'])
+
+    def test_reverse_single_key(self):
+        # plyvel misses the start key of a reverse range holding only it
+        for include_key, include_value, first in ((True, True, (b'b', b'B')),
+                                                  (True, False, b'b'),
+                                                  (False, True, b'B'),
+                                                  (False, False, None)):
+            iterator = keyspace.iterator(self.db, start=b'b', stop=b'b',
+                                         include_stop=True, reverse=True,
+                                         include_key=include_key,
+                                         include_value=include_value)
+            self.assertEqual(list(iterator), [first])
+        self.assertEqual(self.keys(start=b'b', stop=b'b', reverse=True), [])
+        self.assertEqual(self.keys(start=b'bb', stop=b'bb',
+                                   include_stop=True, reverse=True), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
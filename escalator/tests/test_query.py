@@ -0,0 +1,53 @@
+import unittest
+
+from protocol import msg
+from server.query import Query
+
+
+def items(values):
+    return [(key, msg.pack_arg(value)) for key, value in values]
+
+
+class TestQuery(unittest.TestCase):
+
+    values = items([
+        (b'a', {b'age': 30, b'name': b'ann'}),
+        (b'b', {b'age': 17, b'name': b'bob'}),
+        (b'c', {b'name': b'cid'}),
+        (b'd', b'not a map'),
+        (b'e', {b'age': b'old'})
+    ])
+
+    def keys(self, query, include_value=True):
+        return [item[0] if include_value else item
+                for item in query.filter(self.values, include_value)]
+
+    def test_operators(self):
+        self.assertEqual(self.keys(Query([(b'age', '>=', 18)])), [b'a'])
+        self.assertEqual(self.keys(Query([(b'age', b'<', 18)])), [b'b'])
+        self.assertEqual(self.keys(Query([(b'age', '!=', 30)])),
+                         [b'b', b'e'])
+        self.assertEqual(self.keys(Query([(b'name', 'in',
+                                           [b'ann', b'cid'])])),
+                         [b'a', b'c'])
+        self.assertEqual(self.keys(Query([(b'age', '>', 0),
+                                          (b'name', '==', b'bob')]),
+                                   include_value=False), [b'b'])
+
+    def test_no_conditions(self):
+        self.assertEqual(self.keys(Query()),
+                         [b'a', b'b', b'c', b'd', b'e'])
+
+    def test_projection(self):
+        projected = dict(Query(fields=[b'name']).filter(self.values))
+        self.assertEqual(msg.unpack_msg(projected[b'a']), {b'name': b'ann'})
+        self.assertEqual(msg.unpack_msg(projected[b'e']), {})
+        self.assertEqual(projected[b'd'], self.values[3][1])
+
+    def test_invalid(self):
+        self.assertRaises(TypeError, Query, [(b'age', '~', 1)])
+        self.assertRaises(TypeError, Query, [(b'age', 'in', 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
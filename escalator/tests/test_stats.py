@@ -0,0 +1,44 @@
+import unittest
+
+from server.stats import Histogram, bucket_index, bucket_value
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        previous = -1
+        for value in list(range(1000)) + [2 ** 20, 2 ** 40 + 12345]:
+            index = bucket_index(value)
+            self.assertGreaterEqual(index, previous)
+            previous = index
+            low = bucket_value(index)
+            # each bucket is at most 1/16th of its value wide
+            self.assertLessEqual(low, value)
+            self.assertLess(value - low, max(1, low / 16.))
+            self.assertEqual(bucket_index(low), index)
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.record(value, error=value > 990)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 1000)
+        self.assertEqual(summary['errors'], 10)
+        self.assertEqual(summary['max'], 1000)
+        self.assertEqual(summary['mean'], 500)
+        self.assertLessEqual(summary['p50'], 500)
+        self.assertGreater(summary['p50'], 500 * 15 / 16.)
+        self.assertLessEqual(summary['p99'], 990)
+
+    def test_merge(self):
+        a, b = Histogram(), Histogram()
+        a.record(10)
+        b.record(1000, error=True)
+        a.merge(b)
+        self.assertEqual((a.count, a.errors, a.max), (2, 1, 1000))
+        self.assertEqual(a.percentile(100), bucket_value(bucket_index(1000)))
+        self.assertEqual(Histogram().percentile(50), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from protocol import cmd, msg, status, v2
+
+
+class TestV2(unittest.TestCase):
+
+    values = [None, True, False, 0, -1, 1, v2.INT_MIN, v2.INT_MAX,
+              v2.INT_MAX + 1, 2 ** 64 - 1, b'', b'\xc1abc',
+              1.5, [1, [b'a']], {b'k': 2}]
+
+    def test_args(self):
+        for flags in (0, v2.PACKED_ARGS):
+            packed = v2.pack_args(self.values, flags)
+            self.assertEqual(v2.unpack_args(packed, 0, flags), self.values)
+
+    def test_request(self):
+        for flags in (0, v2.PACKED_ARGS):
+            request = v2.format_request(cmd.PUT, 3, 42, b'key', 2 ** 63,
+                                        flags=flags)
+            self.assertEqual(v2.extract_request(request),
+                             (cmd.PUT, 3, 42, flags, [b'key', 2 ** 63]))
+
+    def test_response(self):
+        for flags in (0, v2.PACKED_ARGS):
+            response = msg.pack_response(msg.format_response(2 ** 63, b'v'),
+                                         7, flags)
+            self.assertEqual(v2.response_id(response), 7)
+            self.assertEqual(msg.extract_response(response), [2 ** 63, b'v'])
+
+    def test_error(self):
+        response = msg.pack_response(
+            msg.format_response(b'k', status=status.KEY_NOT_FOUND), 1)
+        self.assertRaises(status.KeyNotFound, msg.extract_response, response)
+
+
+if __name__ == '__main__':
+    unittest.main()